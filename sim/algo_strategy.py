@@ -3,11 +3,10 @@ import random
 import math
 import warnings
 from sys import maxsize
-import json
 from gamelib.game_state import GameState
 from gamelib.unit import GameUnit
 from gamelib.game_map import GameMap
-import copy
+from gamelib.scoring import score_paths
 
 
 
@@ -20,13 +19,15 @@ Advanced strategy tips:
   - You can analyze action frames by modifying on_action_frame function
 
   - The GameState.map object can be manually manipulated to create hypothetical 
-  board states. Though, we recommended making a copy of the map to preserve 
-  the actual current map state.
+  board states. Though, we recommended working on game_state.fork() to preserve 
+  the actual current map state. Forks are much cheaper than copy.deepcopy.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
     def __init__(self):
         super().__init__()
+        # on_action_frame only reads breaches, so the rest of each frame is never decoded
+        self.frame_interests = {"breach"}
         seed = random.randrange(maxsize)
         random.seed(seed)
         gamelib.debug_write('Random seed: {}'.format(seed))
@@ -48,6 +49,10 @@ class AlgoStrategy(gamelib.AlgoCore):
         SP = 0
         # This is a good place to do initial setup
         self.scored_on_locations = []
+        # Worker processes for sim_many, created the first time it is called
+        self.evaluator = None
+        # Simulated outcomes, kept for the whole game so unchanged boards are not simulated again
+        self.transpositions = gamelib.TranspositionTable()
 
     def on_turn(self, turn_state):
         """
@@ -74,7 +79,8 @@ class AlgoStrategy(gamelib.AlgoCore):
     def starter_strategy(self, game_state):
         """
         For defense we will use a spread out layout and some interceptors early on.
-        We will place turrets near locations the opponent managed to score on.
+        We will place interceptors where the opponent managed to score, and turrets
+        next to the tile their predicted attack paths cross most.
         For offense we will use long range demolishers if they place stationary units near the enemy's front.
         If there are no stationary units to attack in the front, we will send Scouts to try and score quickly.
         """
@@ -83,6 +89,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.bd(game_state)
         # Now build reactive defenses based on where the enemy scored
         self.build_reactive_defense(game_state)
+        # And a turret covering the tile the enemy's predicted paths cross most
+        self.build_predicted_defense(game_state)
 
         # If the turn is less than 5, stall with interceptors and wait to see enemy's base
 
@@ -102,6 +110,21 @@ class AlgoStrategy(gamelib.AlgoCore):
         if len(self.scored_on_locations) > 0:
             game_state.attempt_spawn(INTERCEPTOR, self.scored_on_locations[-1])
 
+    def build_predicted_defense(self, game_state):
+        """
+        Instead of waiting for the enemy to score, predict the paths their units
+        would take from every spawn tile and guard the busiest tile on our half.
+        The turret goes on the closest open tile in range of it that no predicted path crosses.
+        """
+        atlas = game_state.enemy_path_atlas()
+        turret_range = self.config["unitInformation"][2]["attackRange"]
+        for busiest in atlas.busiest(1, range(game_state.HALF_ARENA)):
+            options = [location for location in game_state.game_map.get_locations_in_range(busiest, turret_range)
+                       if location[1] < game_state.HALF_ARENA and atlas.traversals_at(location) == 0
+                       and game_state.can_spawn(TURRET, location)]
+            if options:
+                game_state.attempt_spawn(TURRET, min(options, key=lambda location: game_state.game_map.distance_between_locations(location, busiest)))
+
     def bd(self, game_state):
         mid_up = False
         tur_upgraded = False
@@ -226,18 +249,20 @@ class AlgoStrategy(gamelib.AlgoCore):
         It gets the path the unit will take then checks locations on that path to 
         estimate the path's damage risk.
         """
-        damages = []
-        # Get the damage estimate each path will take
-        for location in location_options:
-            path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                # Get number of enemy turrets that can attack each location and multiply by turret damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(TURRET, game_state.config).damage_i
-            damages.append(damage)
-        
+        # Path the options in small batches, as many as the turn budget allows, always at least the first batch
+        chunks = [location_options[start:start + 8] for start in range(0, len(location_options), 8)]
+        options = []
+        paths = []
+        for chunk in (chunks if self.turn_budget is None else self.turn_budget.iterate(chunks)):
+            chunk_paths = game_state.find_paths_to_edges(chunk)
+            options.extend(chunk)
+            paths.extend(chunk_paths[tuple(location)] for location in chunk)
+
+        # Get the damage estimate each path will take, summing the damage of every enemy turret in range of each path location
+        damages = score_paths(game_state, paths)[0]
+
         # Now just return the location that takes the least damage
-        return location_options[damages.index(min(damages))]
+        return options[damages.index(min(damages))]
 
     def detect_enemy_unit(self, game_state, unit_type=None, valid_x = None, valid_y = None):
         total_units = 0
@@ -255,7 +280,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, state):
         """
         This is the action frame of the game. This function could be called 
         hundreds of times per turn and could slow the algo down so avoid putting slow code here.
@@ -263,9 +288,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         Full doc on format of a game frame at in json-docs.html in the root of the Starterkit.
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
-        events = state["events"]
-        breaches = events["breach"]
+        events = state.get("events", {})
+        breaches = events.get("breach", [])
         for breach in breaches:
             location = breach[0]
             unit_owner_self = True if breach[4] == 1 else False
@@ -280,111 +304,24 @@ class AlgoStrategy(gamelib.AlgoCore):
     def sim(self, game_state: GameState, dep: list[list[str, list[int,int]]]):
         """
         Deployments are of form [[type, spawn_location],...]
+        Returns the breaches scored on the opponent, the breaches scored on us,
+        and the structure damage dealt by us and by the opponent.
+        """
+        result = gamelib.Simulator(game_state, transpositions=self.transpositions).simulate(dep)
+        return result.breaches[0], result.breaches[1], result.structure_damage[0], result.structure_damage[1]
+
+    def sim_many(self, game_state, deployment_options):
+        """
+        Like sim, but for a list of candidate deployments, simulated in parallel
+        by the worker processes. Candidates not finished within the turn budget
+        get None instead of a result.
         """
-        stationaries_hit = []
-        scoured_on_op = 0
-        scoured_on_me = 0
-        dmg_on_op = 0
-        dmg_on_me = 0
-        sim = copy.deepcopy(game_state)
-        active = []
-        for unit in dep:
-            if unit[1][1] <= 13:
-                player = 0
-            else: 
-                player = 1
-            new = GameUnit.__init__(unit[0], sim.game_map.config, player, unit[1][0], unit[1][1])
-            active.append((new, 100, [], sim.get_target_edge([unit[0].y, unit[0].y])))
-
-            if not new.stationary:
-                sim.game_map.__map[x][y].append(new)
-            else:
-                sim.game_map.__map[x][y] = [new]
-
-        while active != []:
-            locations = []
-            for nub in active:
-                nub[1] += 1
-                locations.append([nub[0].x,nub[0].y])
-            locations = set(locations)
-
-            for loc in locations:
-                # upraded supports grand shielding
-                for point in sim.game_map.get_locations_in_range(loc, 10):
-                    if not point in nub[2]:
-                        x,y = point
-                        units = sim.game_map[x,y]
-                        is_up_sup = False
-                        for u in units:
-                            if u.unit_type == SUPPORT and u.upgraded:
-                                is_up_sup == True
-                        if is_up_sup:
-                            nub[2].append(point)
-                            nub[0].health += 6 + (0.3 * y)
-                # unupgradded supports grant shielding
-                for point in sim.game_map.get_locations_in_range(loc, 4.5):
-                    if not point in nub[2]:
-                        x,y = point
-                        units = sim.game_map[x,y]
-                        is_sup = False
-                        for u in units:
-                            if u.unit_type == SUPPORT and not u.upgraded:
-                                is_sup == True
-                        if is_sup:
-                            nub[2].append(point)
-                            nub[0].health += 3
-            # move
-            for nub in active:
-                if nub[1] >= nub[0].speed:
-                    next_move = sim.find_path_to_edge([nub[0].x, nub[0].y], nub[3])
- 
-
-                    if next_move is None:
-                        nub[0].health = 0
-                    elif len(next_move == 1):
-                        # blocked or on edge
-                        nub[0].health = 0
-                        x,y = nub[0].x, nub[0].y
-                        if [x,y] in sim.game_map.get_edge_locations(nub[3]):
-                            if nub[0].player_index == 0:
-                                scoured_on_op += 1
-                            else:
-                                scoured_on_me += 1
-                            
-                    else:
-                        nub[0].x = next_move[1][0]
-                        nub[0].y = next_move[1][1]
-                    nub[1] = 0
-            # mobile attack
-            for nub in active:
-                targ = sim.get_target(nub[0])
-                if not targ is None:
-                    if targ.stationary:
-                        stationaries_hit.append(targ)
-                        targ.health -= nub[0].damage_f
-                        if nub[0].player_index == 0:
-                            dmg_on_op += nub[0].damage_f
-                        else:
-                            dmg_on_me += nub[0].damage_f
-                    else:
-                        targ.health -= nub[0].damage_i
-            # sattionary attack
-            attackers = [] 
-            for nub in active:
-                attackers.extend(sim.get_attackers([nub[0].x, nub[0].y], nub[0].player_index))
-            attackers = set(attackers)
-            for att in attackers:
-                sim.get_target(att).health -= att.damage_i
-            # remove dead mobile
-            for nub in active:
-                if nub[0].health <= 0:
-                    active.remove(nub)
-                    sim.game_map.__map.remove(nub[0])
-            #remove dead stationary
-            for defence in stationaries_hit:
-                if defence.health <= 0:
-                    sim.game_map.remove_unit([defence.x, defence.y])
-        return scoured_on_op, scoured_on_me, dmg_on_op, dmg_on_me
+        if self.evaluator is None:
+            self.evaluator = gamelib.ParallelEvaluator(self.config)
+        results = self.evaluator.evaluate(game_state, deployment_options, self.turn_budget, self.transpositions)
+        return [None if result is None else
+                (result.breaches[0], result.breaches[1], result.structure_damage[0], result.structure_damage[1])
+                for result in results]
             
 if __name__ == "__main__":
     algo = AlgoStrategy()
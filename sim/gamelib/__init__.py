@@ -10,12 +10,26 @@ Investigating it is useful for any player that wants to access more information
 The GameUnit class in unit.py represetns a single unit. 
 Investigating it is useful for any player that wants to access information about units. \n
 
+The UnitStore class in unit_store.py holds units column by column, for cheap parsing and queries over every unit at once. \n
+
 The AlgoCore class in algocore.py handles communication with the game engine, and forms the bones of an algo. AlgoStrategy inherits from it. 
 Investigating it is useful for advanced players interested in getting data from the action phase or communicating directly with the game engine. \n
 
 The Navigation class in navigation.py contains functions related to pathfinding, which are used by GameState in pathing related functions. 
 Investigating it is useful for advanced player who want to optimize the slow default pathing algorithm we provide. \n 
 
+The ThreatMap class in threat.py tracks how many enemy structures threaten each tile and how much damage they deal, for cheap path risk estimates. \n
+
+scoring.py scores many candidate paths at once from the threat map, using NumPy when it is installed. \n
+
+The Simulator class in simulator.py plays out an action phase on a copy of a GameState, to predict breaches and structure damage. \n
+
+The ParallelEvaluator class in parallel.py runs many simulations at once on a pool of worker processes. \n
+
+The TranspositionTable class in transposition.py remembers simulated outcomes by board and deployment, so repeated searches skip the simulation. \n
+
+The TurnBudget class in budget.py tracks the time left in a turn, so long searches can stop with their best result so far. \n
+
 util.py contains a small handful of functions that help with communication, including the debug-printing function, debug_write().
 """
 
@@ -24,6 +38,11 @@ from .util import debug_write
 from .game_state import GameState
 from .unit import GameUnit
 from .game_map import GameMap
+from .simulator import Simulator
+from .unit_store import UnitStore
+from .budget import TurnBudget
+from .transposition import TranspositionTable
+from .parallel import ParallelEvaluator
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "budget", "game_state", "game_map", "navigation", "parallel", "scoring", "simulator", "threat", "transposition", "unit", "unit_store", "util"]
  
\ No newline at end of file
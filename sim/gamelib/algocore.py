@@ -1,7 +1,64 @@
-import json
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .unit import UnitTypeTable
+from .simulator import Simulator
+from .budget import TurnBudget
+from .util import get_command, debug_write, decode_json, peek_json, BANNER_TEXT, send_command
+
+
+# Resources are rounded to one decimal place by the engine
+_RESOURCE_TOLERANCE = 0.05
+
+
+def _merge_frames(older, newer):
+    """Combines two action frames into one, keeping the newer frame's fields and both frames' events in order
+    """
+    merged = dict(newer)
+    events = dict(older.get("events", {}))
+    for name, entries in newer.get("events", {}).items():
+        events[name] = events.get(name, []) + entries
+    merged["events"] = events
+    return merged
+
+def _structure_layout(game_map):
+    """The type, owner, location and upgrade state of every structure on a map
+    """
+    layout = set()
+    for x, y in game_map:
+        for unit in game_map._units_at(x, y):
+            if unit.stationary:
+                layout.add((unit.unit_type, unit.player_index, x, y, unit.upgraded))
+    return frozenset(layout)
+
+
+def _speculate(planner, config, frame):
+    """Runs in the speculation process. Predicts the state the next turn will start from and plans for it.
+    """
+    game_state = GameState(config, frame)
+    game_state.suppress_warnings(True)
+    result = Simulator(game_state).simulate([])
+    predicted = result.state
+    # Next turn's income: MP decays before the round's MP is added, and SP grows by the round's SP plus damage dealt
+    resources = config["resources"]
+    for player_index in range(2):
+        player_resources = predicted._player_resources[player_index]
+        player_resources["MP"] = predicted.project_future_MP(1, player_index)
+        player_resources["SP"] += resources["coresPerRound"] + resources.get("coresForPlayerDamage", 0) * result.breach_damage[player_index]
+    predicted.turn_number += 1
+    predicted.my_health -= result.breach_damage[1]
+    predicted.enemy_health -= result.breach_damage[0]
+    # Structures marked for removal are gone by the next turn
+    for x, y in predicted.game_map:
+        units = predicted.game_map._units_at(x, y)
+        if units and units[0].stationary and units[0].pending_removal:
+            predicted.game_map.remove_unit([x, y])
+    return _structure_layout(predicted.game_map), predicted.get_resources(0), planner(predicted)
+
 
 class AlgoCore(object):
     """
@@ -10,23 +67,51 @@ class AlgoCore(object):
 
     Attributes :
         * config (JSON): json object containing information about the game
+        * unit_types (:obj: UnitTypeTable): The stats of every unit type, read once from the config when the game starts
+        * frame_interests (set): The action frame events on_action_frame uses, such as {"breach", "damage"}. When set,
+          action frames are not fully decoded. on_action_frame gets a dict holding only "turnInfo" and an "events" dict
+          with the listed events, each an empty list when the frame has none. None, the default, decodes and passes the whole frame.
+        * frame_queue_size (int): When above 0, on_action_frame runs on a background thread fed by a queue of this many
+          frames, so reading from the engine never waits on it. If the thread falls behind, waiting frames are merged
+          into one with all their events. Every queued frame is handled before on_turn is called. 0, the default,
+          handles frames as they arrive.
+        * speculative_planner (function): When set, called in a separate process at the start of every action phase with
+          a GameState predicting how the next turn will start, including the SP and MP it will bring. Its return value is kept for take_speculative_plan. It must
+          be a module level function so it can be sent to the process, and whatever it returns must be picklable.
+        * turn_budget (:obj: TurnBudget): The time left for the current turn, started when the turn message arrived.
+          Poll it from long searches. Its share of the config's soft time limit is set by turn_budget_share. If the engine
+          reported our last turn (my_time) as taking longer than we measured, the difference is taken off as well.
+        * turn_budget_share (float): The part of the soft time limit turn_budget allows, 0.8 by default
 
     """
     def __init__(self):
         self.config = None
+        self.unit_types = None
+        self.frame_interests = None
+        self.frame_queue_size = 0
+        self._frames = None
+        self._frame_backlog = None
+        self.speculative_planner = None
+        self._speculation_pool = None
+        self._speculation = None
+        self._speculated_turn = None
+        self.turn_budget = None
+        self.turn_budget_share = 0.8
+        self._last_turn_elapsed = None
 
     def on_game_start(self, config):
         """
         This function is called once at the start of the game. 
-        By default, it just initializes the config. \n
+        By default, it just initializes the config and the unit type table. \n
         You can override it it in algo_strategy.py to perform start of game setup
         """
         self.config = config
+        self.unit_types = UnitTypeTable.for_config(config)
 
     def on_turn(self, game_state):
         """
         This step function is called at the start of each turn.
-        It is passed the current game state, which can be used to initiate a new GameState object. 
+        It is passed the current game state, already decoded into a dict, which can be used to initiate a new GameState object. 
         By default, it sends empty commands to the game engine. \n
         algo_strategy.py inherits from AlgoCore and overrides this on turn function. 
         Adjusting the on_turn function in algo_strategy is the main way to adjust your algo's logic. 
@@ -38,12 +123,103 @@ class AlgoCore(object):
         """
         After each deploy phase, the game engine will run the action phase of the round.
         The action phase is made up of a sequence of distinct frames. 
-        Each of these frames is sent to the algo in order. 
+        Each of these frames is sent to the algo in order, already decoded into a dict. 
         They can be handled in this function. 
         """
         pass
 
 
+    def take_speculative_plan(self, game_state, require_match=True):
+        """Gets the plan speculative_planner made during the last action phase, if it is still valid.
+        Call it from on_turn, with the GameState built from the turn's state.
+
+        Args:
+            * game_state: The actual state this turn starts from
+            * require_match: Only return the plan if the predicted structures match the actual ones exactly
+
+        Returns:
+            The planner's return value, or None if there is no plan, it is not finished yet, the prediction was wrong,
+            or this turn has less SP or MP than the planner was given
+
+        """
+        speculation = self._speculation
+        self._speculation = None
+        if speculation is None or not speculation.done():
+            if speculation is not None:
+                speculation.cancel()
+            return None
+        try:
+            predicted_layout, predicted_resources, plan = speculation.result()
+        except Exception:
+            debug_write("speculative_planner failed:\n{}".format(traceback.format_exc()))
+            return None
+        if require_match and predicted_layout != _structure_layout(game_state.game_map):
+            return None
+        # The plan may spend everything the prediction expected, so the real turn has to have at least as much
+        if any(actual < predicted - _RESOURCE_TOLERANCE for actual, predicted in zip(game_state.get_resources(0), predicted_resources)):
+            return None
+        return plan
+
+    def _speculate(self, state):
+        """Starts planning the next turn in the speculation process, once per action phase
+        """
+        turn_number = state["turnInfo"][1]
+        if self._speculated_turn == turn_number:
+            return
+        self._speculated_turn = turn_number
+        if self._speculation_pool is None:
+            self._speculation_pool = ProcessPoolExecutor(max_workers=1)
+        if self._speculation is not None:
+            self._speculation.cancel()
+        self._speculation = self._speculation_pool.submit(_speculate, self.speculative_planner, self.unit_types.config, state)
+
+    def _correct_budget(self, state):
+        """Takes the time the engine saw our last turn take, beyond what we measured ourselves, off this turn's budget.
+        The engine reports it in milliseconds as the last value of p1Stats, which GameState reads as my_time.
+        """
+        stats = state.get("p1Stats")
+        if self._last_turn_elapsed is None or not stats or len(stats) < 4:
+            return
+        overhead = stats[3] / 1000 - self._last_turn_elapsed
+        if overhead > 0:
+            self.turn_budget.limit = max(self.turn_budget.limit - overhead, 0)
+
+    def _start_frame_worker(self):
+        self._frames = queue.Queue(self.frame_queue_size)
+        worker = threading.Thread(target=self._frame_worker, name="action-frames", daemon=True)
+        worker.start()
+
+    def _frame_worker(self):
+        while True:
+            state = self._frames.get()
+            try:
+                self.on_action_frame(state)
+            except Exception:
+                debug_write("on_action_frame failed on a queued frame:\n{}".format(traceback.format_exc()))
+            finally:
+                self._frames.task_done()
+
+    def _queue_frame(self, state):
+        """Hands a frame to the worker, merging it into the backlog if the queue is full
+        """
+        if self._frame_backlog is not None:
+            state = _merge_frames(self._frame_backlog, state)
+            self._frame_backlog = None
+        try:
+            self._frames.put_nowait(state)
+        except queue.Full:
+            self._frame_backlog = state
+
+    def _finish_frames(self):
+        """Waits until the worker has handled every frame received so far
+        """
+        if self._frames is None:
+            return
+        if self._frame_backlog is not None:
+            self._frames.put(self._frame_backlog)
+            self._frame_backlog = None
+        self._frames.join()
+
     def start(self):
         """ 
         Start the parsing loop.
@@ -52,35 +228,67 @@ class AlgoCore(object):
         The algo continues this loop until it recieves the "End" turn message from the game.
         """
         debug_write(BANNER_TEXT)
+        if self.frame_queue_size > 0:
+            self._start_frame_worker()
 
         while True:
             # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
             # manually kill this Python program.
             game_state_string = get_command()
+            received_at = time.monotonic()
             if "replaySave" in game_state_string:
                 """
                 This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                 """
-                parsed_config = json.loads(game_state_string)
+                parsed_config = decode_json(game_state_string)
+                # Built here as well as in on_game_start, since strategies often override it without calling super
+                self.unit_types = UnitTypeTable.for_config(parsed_config)
                 self.on_game_start(parsed_config)
             elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
+                # Decoded once here and handed on, so handlers and GameState do not parse the message again.
+                # Action frames are only decoded in full if the strategy has not said which events it needs.
+                if self.frame_interests is None:
+                    state = decode_json(game_state_string)
+                    stateType = int(state.get("turnInfo")[0])
+                else:
+                    turn_info = peek_json(game_state_string, ["turnInfo"])["turnInfo"]
+                    stateType = int(turn_info[0])
+                    # Speculation needs the whole first frame of an action phase
+                    speculate = self.speculative_planner is not None and self._speculated_turn != turn_info[1]
+                    if stateType == 1 and not speculate:
+                        # Every listed event is present, empty if the frame has none of it
+                        events = {name: [] for name in self.frame_interests}
+                        events.update(peek_json(game_state_string, self.frame_interests, "events"))
+                        state = {"turnInfo": turn_info, "events": events}
+                    else:
+                        state = decode_json(game_state_string)
                 if stateType == 0:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
-                    self.on_turn(game_state_string)
+                    self.turn_budget = TurnBudget.from_config(self.unit_types.config, self.turn_budget_share).start(received_at)
+                    self._correct_budget(state)
+                    self._finish_frames()
+                    self.on_turn(state)
+                    self._last_turn_elapsed = self.turn_budget.elapsed()
                 elif stateType == 1:
                     """
                     If stateType == 1, this game_state_string string represents a single frame of an action phase
                     """
-                    self.on_action_frame(game_state_string)
+                    if self.speculative_planner is not None:
+                        self._speculate(state)
+                    if self._frames is None:
+                        self.on_action_frame(state)
+                    else:
+                        self._queue_frame(state)
                 elif stateType == 2:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
+                    self._finish_frames()
+                    if self._speculation_pool is not None:
+                        self._speculation_pool.shutdown(wait=False, cancel_futures=True)
                     debug_write("Got end state, game over. Stopping algo.")
                     break
                 else:
@@ -0,0 +1,111 @@
+import time
+
+# Used when the config has no soft time limit, in milliseconds like the config's own values
+_DEFAULT_SOFT_LIMIT = 5000
+
+
+class TurnBudget:
+    """The time left to make a turn, measured on a monotonic clock
+
+    AlgoCore starts one as soon as each turn message arrives, so the time spent decoding
+    the message counts too. Long searches poll it and stop with their best result so far
+    once it runs out:
+
+        for option in algo.turn_budget.iterate(options):
+            ...
+
+    Attributes :
+        * limit (float): The number of seconds the turn may take
+        * started_at (float): The clock reading the budget started from, None until start is called
+
+    """
+    def __init__(self, limit, clock=time.monotonic):
+        """Sets up a budget, which does not start counting until start is called
+
+        Args:
+            * limit: The number of seconds the turn may take
+            * clock: A function returning the time in seconds, time.monotonic by default
+
+        """
+        self.limit = limit
+        self.started_at = None
+        self._clock = clock
+
+    @classmethod
+    def from_config(cls, config, share=0.8):
+        """Makes a budget covering part of the soft time limit in a config.
+        Going over the soft limit costs health, so the default leaves a fifth of it spare.
+
+        Args:
+            * config (JSON): Contains information about the game
+            * share: The part of the soft limit to use
+
+        Returns:
+            A TurnBudget that has not started yet
+
+        """
+        soft_limit = config.get("timingAndReplay", {}).get("waitTimeBotSoft", _DEFAULT_SOFT_LIMIT)
+        return cls(soft_limit / 1000 * share)
+
+    def start(self, started_at=None):
+        """Starts counting
+
+        Args:
+            started_at: The clock reading to count from, now by default. Pass the time a message arrived to count its decoding.
+
+        Returns:
+            This budget
+
+        """
+        self.started_at = self._clock() if started_at is None else started_at
+        return self
+
+    def elapsed(self):
+        """The number of seconds since the budget started, 0 if it has not
+        """
+        if self.started_at is None:
+            return 0
+        return self._clock() - self.started_at
+
+    def remaining(self):
+        """The number of seconds left
+        """
+        return self.limit - self.elapsed()
+
+    def expired(self, reserve=0):
+        """Checks whether the budget has run out
+
+        Args:
+            reserve: Seconds to keep in hand, such as the time needed to submit the turn
+
+        Returns:
+            True if no more than reserve seconds are left
+
+        """
+        return self.remaining() <= reserve
+
+    def split(self, share):
+        """Makes a budget for one stage of a turn, so it can not use up the time later stages need
+
+        Args:
+            share: The part of the remaining time the stage may use
+
+        Returns:
+            A started TurnBudget
+
+        """
+        return TurnBudget(max(self.remaining(), 0) * share, self._clock).start()
+
+    def iterate(self, items):
+        """Yields items until the budget runs out. The first item is always yielded, so a search has a result.
+
+        Args:
+            items: An iterable of work items
+
+        """
+        first = True
+        for item in items:
+            if not first and self.expired():
+                return
+            first = False
+            yield item
@@ -1,7 +1,130 @@
 import math
-from .unit import GameUnit
+import copy
+import random
+import struct
+from .unit import GameUnit, UnitTypeTable
 from .util import debug_write
 
+ARENA_SIZE = 28
+HALF_ARENA = ARENA_SIZE // 2
+
+
+def _diamond_contains(x, y):
+    """The diamond arithmetic behind GameMap.in_arena_bounds, only used to build the tables below
+    and for non integer locations.
+    """
+    row_size = y + 1
+    startx = HALF_ARENA - row_size
+    endx = startx + (2 * row_size) - 1
+    top_half_check = (y < HALF_ARENA and x >= startx and x <= endx)
+
+    row_size = (ARENA_SIZE - 1 - y) + 1
+    startx = HALF_ARENA - row_size
+    endx = startx + (2 * row_size) - 1
+    bottom_half_check = (y >= HALF_ARENA and x >= startx and x <= endx)
+
+    return bottom_half_check or top_half_check
+
+
+"""
+Tables describing the board, built once per process. Tiles are indexed by x * ARENA_SIZE + y.
+
+ARENA_MASK: 1 for every tile inside the arena
+ARENA_LOCATIONS: Every (x, y) inside the arena, in the order GameMap iterates them (bottom row first, left to right)
+ARENA_NEIGHBORS: For every tile, the indices of its in-bounds neighbors in the order up, down, right, left
+"""
+ARENA_MASK = bytes(_diamond_contains(x, y) for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+ARENA_LOCATIONS = tuple((x, y) for y in range(ARENA_SIZE) for x in range(ARENA_SIZE) if ARENA_MASK[x * ARENA_SIZE + y])
+ARENA_NEIGHBORS = tuple(
+    tuple(nx * ARENA_SIZE + ny for nx, ny in [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+          if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and ARENA_MASK[nx * ARENA_SIZE + ny])
+    if ARENA_MASK[x * ARENA_SIZE + y] else ()
+    for x in range(ARENA_SIZE) for y in range(ARENA_SIZE))
+
+
+"""
+The binary board format of GameMap.to_bytes: a format version byte, then one flag byte for every tile in
+ARENA_LOCATIONS order, then the health of every tile as a little-endian double. A flag byte is 0 for a tile
+with no structure, otherwise the structure's type index + 1 in the low 4 bits, the owner in bit 4,
+the upgraded flag in bit 5 and the pending removal flag in bit 6.
+"""
+_BOARD_FORMAT_VERSION = 1
+_BOARD_FORMAT = struct.Struct("<B{0}B{0}d".format(len(ARENA_LOCATIONS)))
+_OWNER_BIT = 0x10
+_UPGRADED_BIT = 0x20
+_REMOVAL_BIT = 0x40
+
+# Zobrist keys for GameMap.board_hash, one row of 64 bit keys per (type index, owner, upgraded).
+# Rows are seeded from their own description, so every process and every run gets the same keys.
+_ZOBRIST_ROWS = {}
+
+
+def _zobrist_row(type_index, owner, upgraded):
+    key = (type_index, owner, upgraded)
+    row = _ZOBRIST_ROWS.get(key)
+    if row is None:
+        generator = random.Random("gamelib-zobrist-{}-{}-{}".format(type_index, owner, int(upgraded)))
+        row = tuple(generator.getrandbits(64) for _ in range(ARENA_SIZE * ARENA_SIZE))
+        _ZOBRIST_ROWS[key] = row
+    return row
+
+
+_RANGE_STENCILS = {}
+_CLIPPED_STENCILS = {}
+_TILE_STENCILS = {}
+
+
+def _range_stencil(radius, getHitRadius, inclusive=False):
+    """The (dx, dy) offsets get_locations_in_range covers around an integer location, in the order it returns them.
+    With inclusive, offsets exactly radius + getHitRadius away are covered too, the check shields and
+    get_attackers use. Built the first time each (radius, getHitRadius, inclusive) key is used.
+    """
+    key = (radius, getHitRadius, inclusive)
+    stencil = _RANGE_STENCILS.get(key)
+    if stencil is None:
+        search_radius = math.ceil(radius)
+        # A unit with a given range affects all locations who's centers are within that range + get hit radius
+        stencil = tuple((dx, dy) for dx in range(-search_radius, search_radius + 1) for dy in range(-search_radius, search_radius + 1)
+                        if (math.sqrt(dx ** 2 + dy ** 2) <= radius + getHitRadius if inclusive
+                            else math.sqrt(dx ** 2 + dy ** 2) < radius + getHitRadius))
+        _RANGE_STENCILS[key] = stencil
+    return stencil
+
+
+def _clipped_stencil(radius, getHitRadius, x, y, inclusive=False):
+    """The in-arena locations covered by a range stencil centered on (x, y), cached per tile
+    """
+    key = (radius, getHitRadius, inclusive)
+    tiles = _CLIPPED_STENCILS.get(key)
+    if tiles is None:
+        tiles = [None] * (ARENA_SIZE * ARENA_SIZE)
+        _CLIPPED_STENCILS[key] = tiles
+    index = x * ARENA_SIZE + y
+    clipped = tiles[index]
+    if clipped is None:
+        clipped = tuple((x + dx, y + dy) for dx, dy in _range_stencil(radius, getHitRadius, inclusive)
+                        if 0 <= x + dx < ARENA_SIZE and 0 <= y + dy < ARENA_SIZE and ARENA_MASK[(x + dx) * ARENA_SIZE + y + dy])
+        tiles[index] = clipped
+    return clipped
+
+
+def _tiles_in_range(radius, getHitRadius, x, y, inclusive=False):
+    """Like _clipped_stencil, but as tile indices (x * 28 + y), cached per tile.
+    Threat maps, shields and the simulator all look their ranges up here.
+    """
+    key = (radius, getHitRadius, inclusive)
+    tiles = _TILE_STENCILS.get(key)
+    if tiles is None:
+        tiles = [None] * (ARENA_SIZE * ARENA_SIZE)
+        _TILE_STENCILS[key] = tiles
+    index = x * ARENA_SIZE + y
+    indices = tiles[index]
+    if indices is None:
+        indices = tuple(tx * ARENA_SIZE + ty for tx, ty in _clipped_stencil(radius, getHitRadius, x, y, inclusive))
+        tiles[index] = indices
+    return indices
+
+
 class GameMap:
     """Holds data about the current game map and provides functions
     useful for getting information related to the map.
@@ -18,6 +141,16 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * blocked (bytearray): 1 for every tile holding a structure, indexed by x * ARENA_SIZE + y. Kept up to date as units are added and removed
+        * player_structures (list): One bytearray per player, like blocked but only for that player's structures
+        * board_hash (int): A 64 bit Zobrist hash of the structures on the map (type, owner, location and upgrade).
+          Updated with every structure change, and equal for equal layouts however they were built. Health is not included.
+          Upgrade structures already on the map with upgrade_unit. Calling upgrade() on the unit itself leaves
+          board_hash and any threat maps describing the old unit.
+
+    A GameMap made by fork() shares its tiles with the map it was forked from. The first time a shared tile is
+    returned by game_map[x, y] or changed, the fork takes its own copy of that tile's list and units, so changes
+    to a fork never reach the original. The original should not be changed while its forks are in use.
 
     """
     def __init__(self, config):
@@ -36,36 +169,87 @@ class GameMap:
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
         self.__map = self.__empty_grid()
-        self.__start = [13,0]
+        self.__start = 0
+        self._layout_version = 0
+        self.blocked = bytearray(self.ARENA_SIZE * self.ARENA_SIZE)
+        self.player_structures = [bytearray(self.ARENA_SIZE * self.ARENA_SIZE), bytearray(self.ARENA_SIZE * self.ARENA_SIZE)]
+        self._tile_listeners = []
+        self._type_indices = UnitTypeTable.for_config(config).type_index
+        self.board_hash = 0
+        # The part of board_hash contributed by each tile
+        self._tile_hashes = [0] * (self.ARENA_SIZE * self.ARENA_SIZE)
+        # 1 for every tile still shared with the map this one was forked from, None if it was never forked
+        self._shared = None
     
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
+            if self._shared is not None:
+                return self._writable_tile(x, y)
             return self.__map[x][y]
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
             self.__map[location[0]][location[1]] = val
+            self._release_tile(location[0], location[1])
+            self._refresh_tile(location[0], location[1])
             return
         self._invalid_coordinates(location)
 
     def __iter__(self):
-        self.__start = [13,0]
+        self.__start = 0
         return self
     
     def __next__(self):
-        location = self.__start
-        if location == [15,27]:
+        if self.__start == len(ARENA_LOCATIONS):
             raise StopIteration
-        new_location = [location[0]+1, location[1]]
-        while not self.in_arena_bounds(new_location) and not location == [14,27]:
-            if new_location[0] == self.ARENA_SIZE:
-                new_location = [0, new_location[1]+1]
-            else:
-                new_location = [new_location[0]+1, new_location[1]]
-        self.__start = new_location
-        return location 
+        x, y = ARENA_LOCATIONS[self.__start]
+        self.__start += 1
+        return [x, y]
+
+    def fork(self):
+        """Makes a copy-on-write copy of this map for building hypothetical boards.
+
+        Forking copies the grid of tile lists and the blocked maps, but no units. Tiles are copied the first
+        time the fork reads them through game_map[x, y] or changes them.
+
+        Returns:
+            A new GameMap with the same units as this one
+
+        """
+        forked = GameMap.__new__(GameMap)
+        forked.__dict__.update(self.__dict__)
+        forked.__map = [column[:] for column in self.__map]
+        forked.__start = 0
+        forked.blocked = bytearray(self.blocked)
+        forked.player_structures = [bytearray(structures) for structures in self.player_structures]
+        forked._tile_listeners = []
+        forked._tile_hashes = self._tile_hashes[:]
+        forked._shared = bytearray(ARENA_MASK)
+        return forked
+
+    def _writable_tile(self, x, y):
+        """Gets the units on a tile, first replacing them with private copies if the tile is shared with the original map
+        """
+        if self._shared is None or not self._shared[x * self.ARENA_SIZE + y]:
+            return self.__map[x][y]
+        units = [copy.copy(unit) for unit in self.__map[x][y]]
+        self.__map[x][y] = units
+        self._shared[x * self.ARENA_SIZE + y] = 0
+        return units
+
+    def _release_tile(self, x, y):
+        """Marks a tile whose list was replaced as no longer shared
+        """
+        if self._shared is not None:
+            self._shared[x * self.ARENA_SIZE + y] = 0
+
+    def _units_at(self, x, y):
+        """The units on a tile, without copying a shared tile. Only for callers that will not change them,
+        such as GameState.get_target, GameState.get_attackers and scoring.shield_sources.
+        """
+        return self.__map[x][y]
 
     def __empty_grid(self):
         grid = []
@@ -89,19 +273,9 @@ class GameMap:
         
         """
         x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        if type(x) is int and type(y) is int:
+            return 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE and ARENA_MASK[x * ARENA_SIZE + y] == 1
+        return _diamond_contains(x, y)
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -169,9 +343,18 @@ class GameMap:
         x, y = location
         new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            self._writable_tile(x, y).append(new_unit)
         else:
             self.__map[x][y] = [new_unit]
+            self._release_tile(x, y)
+            self._refresh_tile(x, y)
+
+    def _append_unit(self, unit):
+        """Adds an existing GameUnit to the units at its location, used when parsing the game state.
+        """
+        self._writable_tile(unit.x, unit.y).append(unit)
+        if unit.stationary:
+            self._refresh_tile(unit.x, unit.y)
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -187,6 +370,116 @@ class GameMap:
         
         x, y = location
         self.__map[x][y] = []
+        self._release_tile(x, y)
+        self._refresh_tile(x, y)
+
+    def upgrade_unit(self, location):
+        """Upgrade the structure in the given location, keeping board_hash and threat maps up to date.
+
+        Args:
+            location: The location of the structure to upgrade
+
+        Returns:
+            True if there was a structure to upgrade, False otherwise
+
+        Like add_unit, this only changes the data stored in GameMap and does not affect your turn.
+        Use GameState.attempt_upgrade to upgrade a structure as part of your turn.
+        """
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+            return False
+
+        x, y = location
+        for unit in self._writable_tile(x, y):
+            if unit.stationary:
+                unit.upgrade()
+                self._refresh_tile(x, y)
+                return True
+        return False
+
+    def invalidate_layout(self):
+        """Rebuilds the blocked maps and marks the structure layout as changed so cached paths are recomputed.
+
+        add_unit, remove_unit and assignments through game_map[x, y] do this automatically. Call it yourself
+        after changing the unit lists returned by game_map[x, y] directly.
+        """
+        for x, y in ARENA_LOCATIONS:
+            self._refresh_tile(x, y)
+        self._layout_version += 1
+
+    def _refresh_tile(self, x, y):
+        """Updates the blocked maps for a tile after its structure was added, removed or upgraded,
+        and tells anything tracking structures (like threat maps) about the change.
+        """
+        owner = None
+        blocked = False
+        tile_hash = 0
+        index = x * self.ARENA_SIZE + y
+        for unit in self.__map[x][y]:
+            if unit.stationary:
+                owner = unit.player_index
+                blocked = True
+                tile_hash = _zobrist_row(self._type_indices[unit.unit_type], owner, unit.upgraded)[index]
+                break
+        self.board_hash ^= self._tile_hashes[index] ^ tile_hash
+        self._tile_hashes[index] = tile_hash
+        self.blocked[index] = blocked
+        self.player_structures[0][index] = blocked and owner == 0
+        self.player_structures[1][index] = blocked and owner == 1
+        self._layout_version += 1
+        for listener in self._tile_listeners:
+            listener(x, y)
+
+    def to_bytes(self):
+        """Packs the structures on the map into a fixed size buffer.
+        Mobile units are not included.
+
+        Returns:
+            A bytes object that from_bytes turns back into an equivalent map
+
+        """
+        type_indices = self._type_indices
+        flags = []
+        healths = []
+        for x, y in ARENA_LOCATIONS:
+            for unit in self.__map[x][y]:
+                if unit.stationary:
+                    flags.append((type_indices[unit.unit_type] + 1) | (_OWNER_BIT if unit.player_index == 1 else 0)
+                                 | (_UPGRADED_BIT if unit.upgraded else 0) | (_REMOVAL_BIT if unit.pending_removal else 0))
+                    healths.append(unit.health)
+                    break
+            else:
+                flags.append(0)
+                healths.append(0.0)
+        return _BOARD_FORMAT.pack(_BOARD_FORMAT_VERSION, *flags, *healths)
+
+    @classmethod
+    def from_bytes(cls, config, data):
+        """Builds a map from a buffer made by to_bytes
+
+        Args:
+            * config (JSON): Contains information about the game
+            * data: The buffer
+
+        Returns:
+            A new GameMap holding the packed structures
+
+        """
+        values = _BOARD_FORMAT.unpack(data)
+        if values[0] != _BOARD_FORMAT_VERSION:
+            raise ValueError("Unknown board format version {}".format(values[0]))
+        tile_count = len(ARENA_LOCATIONS)
+        shorthands = [type_config.get("shorthand") for type_config in config["unitInformation"]]
+        game_map = cls(config)
+        for tile, (x, y) in enumerate(ARENA_LOCATIONS):
+            flag = values[1 + tile]
+            if flag:
+                unit = GameUnit(shorthands[(flag & 0x0F) - 1], config, 1 if flag & _OWNER_BIT else 0, values[1 + tile_count + tile], x, y)
+                if flag & _UPGRADED_BIT:
+                    unit.upgrade()
+                unit.pending_removal = bool(flag & _REMOVAL_BIT)
+                game_map._append_unit(unit)
+        return game_map
 
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
@@ -205,9 +498,14 @@ class GameMap:
             self._invalid_coordinates(location)
 
         x, y = location
+        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
+        if type(x) is int and type(y) is int:
+            if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE:
+                return [[i, j] for i, j in _clipped_stencil(radius, getHitRadius, x, y)]
+            return [[x + dx, y + dy] for dx, dy in _range_stencil(radius, getHitRadius) if self.in_arena_bounds([x + dx, y + dy])]
+
         locations = []
         search_radius = math.ceil(radius)
-        getHitRadius = self.config["unitInformation"][0]['getHitRadius']
         for i in range(int(x - search_radius), int(x + search_radius + 1)):
             for j in range(int(y - search_radius), int(y + search_radius + 1)):
                 new_location = [i, j]
@@ -1,9 +1,11 @@
 import math
 import json
 import sys
+import copy
 
-from .navigation import ShortestPathFinder
-from .util import send_command, debug_write
+from .navigation import ShortestPathFinder, PATH_CACHE, WallEffect, PathAtlas
+from .threat import ThreatMap
+from .util import send_command, debug_write, decode_json
 from .unit import GameUnit
 from .game_map import GameMap
 
@@ -52,7 +54,8 @@ class GameState:
 
         Args:
             * config (JSON): A json object containing information about the game
-            * serialized_string (string): A string containing information about the game state at the start of this turn
+            * serialized_string (string or dict): A string containing information about the game state at the start of this turn,
+              or the dict it decodes to. AlgoCore passes the dict so the message is only decoded once.
 
         """
         self.serialized_string = serialized_string
@@ -91,6 +94,13 @@ class GameState:
 
         self.game_map = GameMap(self.config)
         self._shortest_path_finder = ShortestPathFinder()
+        self._path_cache = PATH_CACHE
+        # The PathField of each edge for the layout with this fingerprint, filled in as they are needed
+        self._edge_fields = [None, None, None, None]
+        self._edge_fields_fingerprint = None
+        # (layout fingerprint, PathAtlas) for each player, see enemy_path_atlas
+        self._path_atlases = [None, None]
+        self._threat_maps = [None, None]
         self._build_stack = []
         self._deploy_stack = []
         self._player_resources = [
@@ -101,9 +111,9 @@ class GameState:
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, or already decoded.
         """
-        state = json.loads(state_line)
+        state = decode_json(state_line) if isinstance(state_line, (str, bytes)) else state_line
 
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
@@ -144,10 +154,10 @@ class GameState:
                         self.game_map[x,y][0].pending_removal = True
                 elif unit_type == UPGRADE:
                     if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].upgrade()
+                        self.game_map.upgrade_unit([x, y])
                 else:
                     unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+                    self.game_map._append_unit(unit)
 
     def __resource_required(self, unit_type):
         return self.SP if is_stationary(unit_type) else self.MP
@@ -331,7 +341,7 @@ class GameState:
 
         affordable = self.number_affordable(unit_type) >= num
         stationary = is_stationary(unit_type)
-        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
+        blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map._units_at(location[0], location[1])) > 0)
         correct_territory = location[1] < self.HALF_ARENA
         on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
 
@@ -445,7 +455,7 @@ class GameState:
                     if resources[SP] >= costs[SP] and resources[MP] >= costs[MP]:
                         self.__set_resource(SP, 0 - costs[SP])
                         self.__set_resource(MP, 0 - costs[MP])
-                        existing_unit.upgrade()
+                        self.game_map.upgrade_unit([x, y])
                         self._build_stack.append((UPGRADE, x, y))
                         spawned_units += 1
             else:
@@ -488,15 +498,228 @@ class GameState:
             to get from it's starting location to the best available end location
 
         """
-        if self.contains_stationary_unit(start_location):
-            self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+        start = (int(start_location[0]), int(start_location[1]))
+        return self.find_paths_to_edges([start_location], target_edge)[start]
+
+    def find_paths_to_edges(self, start_locations, target_edge=None):
+        """Gets the paths units at many locations would take.
+        Starts heading to the same edge share one blocked map and distance field, which is much faster than
+        calling find_path_to_edge in a loop.
+
+        Args:
+            start_locations: A list of locations of hypothetical units
+            target_edge: The edge every unit wants to reach. Induced from each start location if None.
+
+        Returns:
+            A dict mapping each start location, as an (x, y) tuple, to the path find_path_to_edge would return for it
+
+        """
+        starts_by_edge = {}
+        for start_location in start_locations:
+            edge = self.get_target_edge(start_location) if target_edge is None else target_edge
+            starts_by_edge.setdefault(edge, []).append(start_location)
+
+        # Paths only depend on the structure layout, so repeated queries are served from the path cache
+        fingerprint = self._shortest_path_finder.layout_fingerprint(self)
+        paths = {}
+        for edge, starts in starts_by_edge.items():
+            cached_paths = self._path_cache.paths(fingerprint, edge)
+            field = None
+            for start_location in starts:
+                start = (int(start_location[0]), int(start_location[1]))
+                if self.contains_stationary_unit(start_location):
+                    self.warn("Attempted to perform pathing from blocked starting location {}".format(start_location))
+                    paths[start] = None
+                    continue
+                steps = cached_paths.get(start)
+                if steps is None:
+                    if field is None:
+                        field = self.path_field(edge)
+                    path = field.path_from(start_location)
+                    steps = tuple((x, y) for x, y in path[1:])
+                    cached_paths[start] = steps
+                paths[start] = [start_location] + [[x, y] for x, y in steps]
+        return paths
+
+    def path_field(self, target_edge):
+        """Gets the distance field units use to path to an edge.
+        It is computed once per structure layout and edge, and can then answer path queries for any number of start locations.
+
+        Args:
+            target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc.
+
+        Returns:
+            A PathField. Use path_from(start_location) to get the path a unit would take, or reaches_edge(location)
+            to check whether a unit at location could reach the edge at all.
+
+        """
+        fields = self._current_edge_fields()
+        field = fields[target_edge]
+        if field is None:
+            field = self._path_cache.field(self._edge_fields_fingerprint, target_edge, self.game_map.get_edge_locations(target_edge))
+            fields[target_edge] = field
+        return field
+
+    def edge_distances(self):
+        """Gets the distance from every tile to each of the four edges, for the current structure layout.
+        All four are computed together the first time they are needed for a layout, and kept on this state
+        for path_field, find_path_to_edge and find_paths_to_edges until the layout changes.
+
+        Returns:
+            A list of four flat lists indexed by edge (game_map.TOP_RIGHT, game_map.TOP_LEFT, etc.). Each holds
+            the number of steps from every tile to that edge, indexed by x * 28 + y, or -1 if the edge can not be reached.
+            Do not change them.
+
+        """
+        fields = self._current_edge_fields()
+        if None in fields:
+            fields[:] = self._path_cache.edge_fields(self._edge_fields_fingerprint, self.game_map.get_edges())
+        return [field.pathlength for field in fields]
+
+    def can_reach_edge(self, location, target_edge=None):
+        """Checks whether a unit at location could reach an edge, rather than self destructing
+
+        Args:
+            location: The location of a hypothetical unit
+            target_edge: The edge the unit wants to reach. Induced from location if None.
+
+        Returns:
+            True if location is open and connected to the edge, False otherwise
+
+        """
+        edge = self.get_target_edge(location) if target_edge is None else target_edge
+        return self.path_field(edge).reaches_edge(location)
+
+    def wall_placement_effects(self, player_index=1, start_locations=None):
+        """Works out, for every tile a wall could be built on, how a wall there would change the paths of a player's mobile units.
+
+        Only paths that run through a tile can change when it is blocked, so the paths are found once and then
+        only the units whose path crosses a tile are walked again for it, over a distance field repaired for
+        the one new wall. On a busy board a full sweep takes a few tens of milliseconds.
+
+        Args:
+            * player_index: The player whose units are pathing, 1 by default to ask how walls on your half change the enemy's paths
+            * start_locations: Where those units start. The open tiles of the player's two spawn edges by default.
+
+        Returns:
+            A dict mapping every open (x, y) tile on the other player's half to a WallEffect
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
             return
+        game_map = self.game_map
+        if start_locations is None:
+            start_locations = self._spawn_edge_locations(player_index)
+        damage = self.threat_map(player_index).damage
+
+        # The current path of every unit, and the units whose path each tile can change
+        starts = []
+        crossing = {}
+        path_counts = {}
+        for location in start_locations:
+            start = location[0] * self.ARENA_SIZE + location[1]
+            if game_map.blocked[start]:
+                continue
+            edge = self.get_target_edge(location)
+            field = self.path_field(edge)
+            path = [x * self.ARENA_SIZE + y for x, y in field.path_from(location)]
+            reaches = field.reaches_edge(location)
+            unit = len(starts)
+            starts.append((location, edge, path, reaches, sum(damage[tile] for tile in path)))
+            # Blocking a tile off the path of a unit that reaches its edge leaves that path as it is.
+            # A unit that can not reach its edge can be affected by any tile in its pocket.
+            for tile in (set(path) if reaches else field._pocket_tiles(start)):
+                crossing.setdefault(tile, []).append(unit)
+            for tile in set(path):
+                path_counts[tile] = path_counts.get(tile, 0) + 1
+        current_tiles = frozenset(divmod(tile, self.ARENA_SIZE) for tile in path_counts)
+
+        defender_rows = range(self.HALF_ARENA) if player_index == 1 else range(self.HALF_ARENA, self.ARENA_SIZE)
+        effects = {}
+        for x in range(self.ARENA_SIZE):
+            for y in defender_rows:
+                tile = x * self.ARENA_SIZE + y
+                if not game_map.in_arena_bounds([x, y]) or game_map.blocked[tile]:
+                    continue
+                units = crossing.get(tile)
+                if not units:
+                    effects[(x, y)] = WallEffect([x, y], 0, 0.0, current_tiles, 0, 0)
+                    continue
 
-        if target_edge is None:
-            target_edge = self.get_target_edge(start_location)
+                walled_fields = {}
+                counts = dict(path_counts)
+                length_change = 0
+                exposure_change = 0.0
+                changed_paths = 0
+                blocks_edge = 0
+                for unit in units:
+                    location, edge, path, reaches, exposure = starts[unit]
+                    walled = walled_fields.get(edge)
+                    if walled is None:
+                        walled = self.path_field(edge).with_tile_flipped([x, y])
+                        walled_fields[edge] = walled
+                    new_path = walled.path_from(location)
+                    # A wall on the start tile itself leaves the unit nowhere to walk
+                    new_path = [] if new_path is None else [px * self.ARENA_SIZE + py for px, py in new_path]
+                    if new_path == path:
+                        continue
+                    changed_paths += 1
+                    if reaches and not (new_path and walled.reaches_edge(location)):
+                        blocks_edge += 1
+                    length_change += len(new_path) - len(path)
+                    exposure_change += sum(damage[step] for step in new_path) - exposure
+                    for step in set(path):
+                        counts[step] -= 1
+                    for step in set(new_path):
+                        counts[step] = counts.get(step, 0) + 1
+                path_tiles = current_tiles if not changed_paths else frozenset(
+                    divmod(step, self.ARENA_SIZE) for step, count in counts.items() if count > 0)
+                effects[(x, y)] = WallEffect([x, y], length_change, exposure_change, path_tiles, changed_paths, blocks_edge)
+        return effects
+
+    def enemy_path_atlas(self, player_index=1):
+        """Predicts the paths of a player's mobile units from every open tile of that player's spawn edges.
+        The paths share the cached distance fields, and the atlas is kept until the structure layout changes,
+        so calling it every turn is cheap.
 
-        end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        Args:
+            player_index: The player whose units are pathing, the enemy by default
+
+        Returns:
+            A PathAtlas holding every path and how many of them cross each tile
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+        fingerprint = self._shortest_path_finder.layout_fingerprint(self)
+        cached = self._path_atlases[player_index]
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        start_locations = [location for location in self._spawn_edge_locations(player_index)
+                           if not self.game_map.blocked[location[0] * self.ARENA_SIZE + location[1]]]
+        atlas = PathAtlas(player_index, self.find_paths_to_edges(start_locations))
+        self._path_atlases[player_index] = (fingerprint, atlas)
+        return atlas
+
+    def _spawn_edge_locations(self, player_index):
+        """The locations along the two edges a player's mobile units spawn on
+        """
+        game_map = self.game_map
+        spawn_edges = [game_map.TOP_LEFT, game_map.TOP_RIGHT] if player_index == 1 else [game_map.BOTTOM_LEFT, game_map.BOTTOM_RIGHT]
+        return [location for edge in spawn_edges for location in game_map.get_edge_locations(edge)]
+
+    def _current_edge_fields(self):
+        """The edge fields kept on this state, brought up to date first if the layout changed since they were found
+        """
+        fingerprint = self._shortest_path_finder.layout_fingerprint(self)
+        if fingerprint != self._edge_fields_fingerprint:
+            # Fields of the previous layout are repaired when only one structure was added or removed since
+            self._edge_fields = [None if field is None else self._path_cache.repaired_field(fingerprint, edge, field)
+                                 for edge, field in enumerate(self._edge_fields)]
+            self._edge_fields_fingerprint = fingerprint
+        return self._edge_fields
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked, return structures unit if it is
@@ -512,6 +735,8 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
+        if not self.game_map.blocked[x * self.ARENA_SIZE + y]:
+            return False
         for unit in self.game_map[x,y]:
             if unit.stationary:
                 return unit
@@ -546,7 +771,8 @@ class GameState:
             attacking_unit: A GameUnit
 
         Returns:
-            The GameUnit this unit would choose to attack.
+            The GameUnit this unit would choose to attack. On a fork it may still be shared with the original
+            state, so read game_map[x, y] at its location first if you are going to change it.
 
         """
 
@@ -564,7 +790,7 @@ class GameState:
         target_x_distance = 0
 
         for location in possible_locations:
-            for unit in self.game_map[location]:
+            for unit in self.game_map._units_at(location[0], location[1]):
                 if unit.player_index == attacking_unit.player_index or (attacking_unit.damage_f == 0 and is_stationary(unit.unit_type)) or (attacking_unit.damage_i == 0 and not(is_stationary(unit.unit_type))):
                     continue
 
@@ -614,6 +840,48 @@ class GameState:
                     target_x_distance = unit_x_distance
         return target
 
+    def fork(self):
+        """Makes a cheap copy of this game state for trying out hypothetical moves.
+        Use it instead of copy.deepcopy(game_state).
+
+        The copy shares the config and, until they are changed, the units of this state. Its map copies a tile
+        the first time it is accessed, and resources, queued commands and threat maps are copied right away,
+        so nothing done to the copy affects this state. Do not change this state while its forks are in use.
+
+        Returns:
+            A new GameState
+
+        """
+        forked = copy.copy(self)
+        forked.game_map = self.game_map.fork()
+        forked._shortest_path_finder = ShortestPathFinder()
+        forked._edge_fields = list(self._edge_fields)
+        forked._path_atlases = list(self._path_atlases)
+        forked._threat_maps = [None if threat is None else threat.fork(forked.game_map) for threat in self._threat_maps]
+        forked._build_stack = list(self._build_stack)
+        forked._deploy_stack = list(self._deploy_stack)
+        forked._player_resources = [dict(resources) for resources in self._player_resources]
+        return forked
+
+    def threat_map(self, player_index):
+        """Gets the threat structures pose to a player's mobile units on every tile.
+        It is built the first time it is requested and then kept up to date as structures are spawned, removed or upgraded.
+
+        Args:
+            player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            A ThreatMap holding, for every tile, the number of structures that would attack a unit of the given player
+            there and their total damage per frame
+
+        """
+        if not player_index == 0 and not player_index == 1:
+            self._invalid_player_index(player_index)
+            return
+        if self._threat_maps[player_index] is None:
+            self._threat_maps[player_index] = ThreatMap(self.game_map, player_index)
+        return self._threat_maps[player_index]
+
     def get_attackers(self, location, player_index):
         """Gets the stationary units threatening a given location
 
@@ -622,7 +890,8 @@ class GameState:
             player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
 
         Returns:
-            A list of units that would attack a unit controlled by the given player at the given location
+            A list of units that would attack a unit controlled by the given player at the given location.
+            On a fork they may still be shared with the original state, like the result of get_target.
 
         """
 
@@ -641,7 +910,7 @@ class GameState:
                 max_range = unit.get('attackRange', 0)
         possible_locations= self.game_map.get_locations_in_range(location, max_range)
         for location_unit in possible_locations:
-            for unit in self.game_map[location_unit]:
+            for unit in self.game_map._units_at(location_unit[0], location_unit[1]):
                 if unit.damage_i + unit.damage_f > 0 and unit.player_index != player_index and self.game_map.distance_between_locations(location, location_unit) <= unit.attackRange:
                     attackers.append(unit)
         return attackers
@@ -1,24 +1,566 @@
-import heapq
-import math
 import sys
-import queue
+import heapq
+from collections import deque, OrderedDict
 from .util import debug_write
+from .game_map import ARENA_SIZE, HALF_ARENA, ARENA_NEIGHBORS as _NEIGHBORS
+
+TILE_COUNT = ARENA_SIZE * ARENA_SIZE
+
+
+def _build_idealness(direction):
+    idealness = [0] * TILE_COUNT
+    for x in range(ARENA_SIZE):
+        for y in range(ARENA_SIZE):
+            value = 28 * y if direction[1] == 1 else 28 * (27 - y)
+            value += x if direction[0] == 1 else 27 - x
+            idealness[x * ARENA_SIZE + y] = value
+    return idealness
+
+
+_IDEALNESS = {direction: _build_idealness(direction) for direction in [(1, 1), (-1, 1), (1, -1), (-1, -1)]}
+_UNVISITED = [-1] * TILE_COUNT
+_CLEAR = bytes(TILE_COUNT)
+HORIZONTAL = 1
+VERTICAL = 2
 
-class Node:
-    """A pathfinding node
+
+class PathCache:
+    """Least recently used cache of paths and distance fields, shared by every GameState
+
+    Entries are grouped by structure layout and target edge. The layout is identified by the
+    bytes of the pathfinder's blocked-tile bitmap, so the same layout seen again later in a turn,
+    or on a later turn, reuses the work already done for it.
 
     Attributes :
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a structures at this node's location
-        * pathlength: The distance between this node and the target location
+        * max_layouts (int): The number of (layout, edge) groups kept before the least recently used one is dropped
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, max_layouts=64):
+        self.max_layouts = max_layouts
+        self._entries = OrderedDict()
+
+    def _entry(self, fingerprint, target_edge):
+        key = (fingerprint, target_edge)
+        entry = self._entries.get(key)
+        if entry is None:
+            # [paths by start tile, PathField]
+            entry = [{}, None]
+            self._entries[key] = entry
+            if len(self._entries) > self.max_layouts:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def paths(self, fingerprint, target_edge):
+        """Gets the cached paths for a layout and edge
+
+        Args:
+            * fingerprint: The layout fingerprint, see ShortestPathFinder.layout_fingerprint
+            * target_edge: The edge the paths lead to
+
+        Returns:
+            A dict mapping (x, y) start tiles to the steps after the start. Add new paths to it directly.
+
+        """
+        return self._entry(fingerprint, target_edge)[0]
+
+    def field(self, fingerprint, target_edge, end_points):
+        """Gets the PathField for a layout and edge, computing it if it is not cached
+
+        Args:
+            * fingerprint: The layout fingerprint, see ShortestPathFinder.layout_fingerprint
+            * target_edge: The edge the paths lead to
+            * end_points: The locations along target_edge
+
+        Returns:
+            A PathField for the layout
+
+        """
+        entry = self._entry(fingerprint, target_edge)
+        if entry[1] is None:
+            entry[1] = PathField(fingerprint, end_points)
+        return entry[1]
+
+    def repaired_field(self, fingerprint, target_edge, previous):
+        """Gets the PathField for a layout, repairing one from a layout that differs by a single tile if it is not cached
+
+        Args:
+            * fingerprint: The layout fingerprint, see ShortestPathFinder.layout_fingerprint
+            * target_edge: The edge the paths lead to
+            * previous: The PathField for the same edge on an earlier layout
+
+        Returns:
+            A PathField for the layout, or None if it is not cached and the layouts differ by more than one tile
+
+        """
+        entry = self._entries.get((fingerprint, target_edge))
+        if entry is not None and entry[1] is not None:
+            self._entries.move_to_end((fingerprint, target_edge))
+            return entry[1]
+        tile = _flipped_tile(previous._blocked, fingerprint)
+        if tile is None:
+            return None
+        entry = self._entry(fingerprint, target_edge)
+        entry[1] = PathField(fingerprint, previous.end_points, _repair(fingerprint, previous._seeds, previous.pathlength, tile))
+        return entry[1]
+
+    def edge_fields(self, fingerprint, edges):
+        """Gets the PathFields of a layout for every edge, computing the ones not cached together
+
+        Args:
+            * fingerprint: The layout fingerprint, see ShortestPathFinder.layout_fingerprint
+            * edges: The locations along each edge, as returned by GameMap.get_edges
+
+        Returns:
+            A list with the PathField for each edge, in the order of edges
+
+        """
+        entries = [self._entry(fingerprint, target_edge) for target_edge in range(len(edges))]
+        missing = [target_edge for target_edge, entry in enumerate(entries) if entry[1] is None]
+        if missing:
+            fields = _edge_distances(fingerprint, [edges[target_edge] for target_edge in missing])
+            for target_edge, pathlength in zip(missing, fields):
+                entries[target_edge][1] = PathField(fingerprint, edges[target_edge], pathlength)
+        return [entry[1] for entry in entries]
+
+    def clear(self):
+        """Drops every cached path
+        """
+        self._entries.clear()
+
+
+PATH_CACHE = PathCache()
+
+def _flood(blocked, seeds, pathlength, frontier):
+    """Breadth first search outward from the seeds, setting the pathlength of every reachable tile.
+    Blocked seeds get a pathlength of 0 but are never expanded.
+    """
+    frontier.clear()
+    for location in seeds:
+        pathlength[location] = 0
+        frontier.append(location)
+
+    while frontier:
+        current_location = frontier.popleft()
+        if blocked[current_location]:
+            continue
+        next_length = pathlength[current_location] + 1
+        for neighbor in _NEIGHBORS[current_location]:
+            if blocked[neighbor] or pathlength[neighbor] != -1:
+                continue
+            pathlength[neighbor] = next_length
+            frontier.append(neighbor)
+
+
+def _flipped_tile(before, after):
+    """The index of the only tile that differs between two blocked maps, or None if no tile or several do
+    """
+    difference = int.from_bytes(before, "big") ^ int.from_bytes(after, "big")
+    if difference == 0 or difference & (difference - 1):
+        return None
+    return len(after) - 1 - (difference.bit_length() - 1) // 8
+
+
+def _repair(blocked, seeds, pathlength, tile):
+    """Updates a distance field for one tile that became blocked or open, instead of flooding it again.
+
+    Opening a tile can only shorten distances, so they are lowered outward from it. Blocking a tile can only
+    lengthen the distances of tiles whose every shortest route ran through it. Those are found by following
+    the field downhill from the tile, reset, and flooded again from the unaffected tiles around them.
+
+    Args:
+        * blocked: The blocked map after the change
+        * seeds: The set of tiles the field was flooded from
+        * pathlength: The field before the change
+        * tile: The index of the tile that changed
+
+    Returns:
+        A new list holding the field after the change, the same as flooding it from scratch
+
+    """
+    pathlength = list(pathlength)
+    if not blocked[tile]:
+        if tile not in seeds:
+            best = -1
+            for neighbor in _NEIGHBORS[tile]:
+                if not blocked[neighbor] and pathlength[neighbor] != -1 and (best == -1 or pathlength[neighbor] < best):
+                    best = pathlength[neighbor]
+            if best == -1:
+                return pathlength
+            pathlength[tile] = best + 1
+        frontier = deque([tile])
+        while frontier:
+            current = frontier.popleft()
+            next_length = pathlength[current] + 1
+            for neighbor in _NEIGHBORS[current]:
+                if blocked[neighbor] or (pathlength[neighbor] != -1 and pathlength[neighbor] <= next_length):
+                    continue
+                pathlength[neighbor] = next_length
+                frontier.append(neighbor)
+        return pathlength
+
+    if pathlength[tile] == -1:
+        return pathlength
+    # Tiles that only had shortest routes through the changed tile, found level by level
+    affected = {tile}
+    order = []
+    frontier = deque([tile])
+    while frontier:
+        current = frontier.popleft()
+        child_length = pathlength[current] + 1
+        for child in _NEIGHBORS[current]:
+            if child in affected or blocked[child] or pathlength[child] != child_length or child in seeds:
+                continue
+            for parent in _NEIGHBORS[child]:
+                if pathlength[parent] == child_length - 1 and parent not in affected and not blocked[parent]:
+                    break
+            else:
+                affected.add(child)
+                order.append(child)
+                frontier.append(child)
+    if tile not in seeds:
+        pathlength[tile] = -1
+    for current in order:
+        pathlength[current] = -1
+
+    heap = []
+    for current in order:
+        for neighbor in _NEIGHBORS[current]:
+            if not blocked[neighbor] and pathlength[neighbor] != -1:
+                heap.append((pathlength[neighbor] + 1, current))
+    heapq.heapify(heap)
+    while heap:
+        length, current = heapq.heappop(heap)
+        if pathlength[current] != -1:
+            continue
+        pathlength[current] = length
+        for neighbor in _NEIGHBORS[current]:
+            if pathlength[neighbor] == -1 and neighbor in affected and neighbor != tile:
+                heapq.heappush(heap, (length + 1, neighbor))
+    return pathlength
+
+
+def _edge_distances(blocked, edges):
+    """Floods the distance field of several edges over one blocked map, sharing a single frontier.
+    Measured faster than one breadth first search carrying the edge along with every queued tile.
+    """
+    frontier = deque()
+    fields = []
+    for end_points in edges:
+        pathlength = list(_UNVISITED)
+        _flood(blocked, [x * ARENA_SIZE + y for x, y in end_points], pathlength, frontier)
+        fields.append(pathlength)
+    return fields
+
+
+def _walk(start_point, direction, blocked, pathlength, move_direction=0):
+    """Follows a validated pathlength field from start_point down to a tile with pathlength 0
+    """
+    path = [start_point]
+    current = start_point[0] * ARENA_SIZE + start_point[1]
+
+    while not pathlength[current] == 0:
+        next_move = _choose_next_move(current, move_direction, direction, blocked, pathlength)
+
+        if current // ARENA_SIZE == next_move // ARENA_SIZE:
+            move_direction = VERTICAL
+        else:
+            move_direction = HORIZONTAL
+        path.append([next_move // ARENA_SIZE, next_move % ARENA_SIZE])
+        current = next_move
+
+    return path
+
+
+def _choose_next_move(current_point, previous_move_direction, direction, blocked, pathlength):
+    """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
+    """
+    current_tile = divmod(current_point, ARENA_SIZE)
+
+    ideal_neighbor = current_point
+    ideal_tile = current_tile
+    best_pathlength = pathlength[current_point]
+    for neighbor in _NEIGHBORS[current_point]:
+        if blocked[neighbor]:
+            continue
+
+        current_pathlength = pathlength[neighbor]
+        neighbor_tile = divmod(neighbor, ARENA_SIZE)
+
+        #Filter by pathlength
+        if current_pathlength > best_pathlength:
+            continue
+        #Filter by direction based on prev move
+        if current_pathlength == best_pathlength and not _better_direction(current_tile, neighbor_tile, ideal_tile, previous_move_direction, direction):
+            continue
+
+        ideal_neighbor = neighbor
+        ideal_tile = neighbor_tile
+        best_pathlength = current_pathlength
+
+    return ideal_neighbor
+
+
+def _better_direction(prev_tile, new_tile, prev_best, previous_move_direction, direction):
+    """Compare two tiles and return True if the unit would rather move to the new one
+
+    """
+    #True if we are moving in a different direction than prev move and prev is not
+    #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
+    if previous_move_direction == HORIZONTAL and not new_tile[0] == prev_best[0]:
+        #We want to go up now. If we have not changed our y, we are not going up
+        if prev_tile[1] == new_tile[1]:
+            return False
+        return True
+    if previous_move_direction == VERTICAL and not new_tile[1] == prev_best[1]:
+        if prev_tile[0] == new_tile[0]:
+            return False
+        return True
+    if previous_move_direction == 0:
+        if prev_tile[1] == new_tile[1]:
+            return False
+        return True
+
+    #To make it here, both moves are on the same axis
+    if new_tile[1] == prev_best[1]: #If they both moved horizontal...
+        if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
+            return True
+        if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
+            return True
+        return False
+    if new_tile[0] == prev_best[0]: #If they both moved vertical...
+        if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
+            return True
+        if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
+            return True
+        return False
+    return True
+
+
+def _direction_from_endpoints(end_points):
+    x, y = end_points[0]
+    return (-1 if x < HALF_ARENA else 1, -1 if y < HALF_ARENA else 1)
+
+
+class PathField:
+    """Distance fields for one structure layout and target edge, shared by every start location
+
+    The field towards the edge is computed once up front. Start locations whose pocket of
+    pathable space does not touch the edge path to their best self destruct tile instead,
+    which needs a field of its own. Those are computed the first time a start in that
+    pocket is queried and reused for every other start in the same pocket.
+
+    A field for a layout one tile away from a layout whose field is known can be repaired from it
+    instead, see PathCache.repaired_field.
+
+    Attributes :
+        * end_points (list): The edge locations units are trying to reach
+        * direction (tuple): The direction of the edge, (1, 1) for the top right and (-1, 1) for the top left
+        * pathlength (list): The distance from each tile to the edge, indexed by x * 28 + y. -1 if the edge is unreachable
+
+    """
+    def __init__(self, blocked, end_points, pathlength=None):
+        """Computes the distance field towards the edge
+
+        Args:
+            * blocked: A bytes-like bitmap of structure tiles, indexed by x * 28 + y
+            * end_points: The edge locations units are trying to reach
+            * pathlength: The distance field, if it was already computed
+
+        """
+        self.end_points = end_points
+        self.direction = _direction_from_endpoints(end_points)
+        self._blocked = blocked
+        self._seeds = frozenset(x * ARENA_SIZE + y for x, y in end_points)
+        self._frontier = deque()
+        self._pocket_ideal = {}
+        self._pocket_fields = {}
+        if pathlength is None:
+            pathlength = list(_UNVISITED)
+            _flood(blocked, [x * ARENA_SIZE + y for x, y in end_points], pathlength, self._frontier)
+        self.pathlength = pathlength
+
+    def with_tile_flipped(self, location):
+        """Makes the field for this layout with one tile blocked or opened, repairing this field rather than flooding a new one.
+        The new field is not added to the path cache, so trying many tiles does not push useful layouts out of it.
+
+        Args:
+            location: The tile to flip
+
+        Returns:
+            A new PathField
+
+        """
+        tile = location[0] * ARENA_SIZE + location[1]
+        blocked = bytearray(self._blocked)
+        blocked[tile] = not blocked[tile]
+        blocked = bytes(blocked)
+        return PathField(blocked, self.end_points, _repair(blocked, self._seeds, self.pathlength, tile))
+
+    def reaches_edge(self, location):
+        """Checks if a unit at location can reach the edge
+
+        Args:
+            location: A map location
+
+        Returns:
+            True if location is open and connected to the edge, False otherwise
+
+        """
+        index = location[0] * ARENA_SIZE + location[1]
+        return not self._blocked[index] and self.pathlength[index] != -1
+
+    def path_from(self, start_point):
+        """Gets the path a unit at start_point would take
+
+        Args:
+            start_point: The starting location of the unit
+
+        Returns:
+            The same path ShortestPathFinder.navigate_multiple_endpoints would return, or None if start_point is blocked
+
+        """
+        start = start_point[0] * ARENA_SIZE + start_point[1]
+        if self._blocked[start]:
+            return None
+        return _walk(start_point, self.direction, self._blocked, self._field_for(start))
+
+    def next_step(self, location, move_direction=0):
+        """Gets the tile a unit at location moves to next
+
+        Args:
+            * location: The current location of the unit
+            * move_direction: How the unit moved last, HORIZONTAL, VERTICAL, or 0 if it has not moved yet
+
+        Returns:
+            The next location as [x, y], or None if the unit is blocked or has reached the end of its path
+
+        """
+        current = location[0] * ARENA_SIZE + location[1]
+        if self._blocked[current]:
+            return None
+        field = self._field_for(current)
+        if field[current] == 0:
+            return None
+        next_move = _choose_next_move(current, move_direction, self.direction, self._blocked, field)
+        return [next_move // ARENA_SIZE, next_move % ARENA_SIZE]
+
+    def _pocket_tiles(self, start):
+        """The open tiles connected to start, for a start that can not reach the edge
+        """
+        ideal_tile = self._pocket_ideal.get(start)
+        if ideal_tile is None:
+            ideal_tile = self._search_pocket(start)
+        return [tile for tile, ideal in self._pocket_ideal.items() if ideal == ideal_tile]
+
+    def _field_for(self, start):
+        """Gets the field a unit at start follows, the edge field if it can reach the edge
+        """
+        if self.pathlength[start] != -1:
+            return self.pathlength
+        ideal_tile = self._pocket_ideal.get(start)
+        if ideal_tile is None:
+            ideal_tile = self._search_pocket(start)
+        field = self._pocket_fields.get(ideal_tile)
+        if field is None:
+            field = list(_UNVISITED)
+            _flood(self._blocked, [ideal_tile], field, self._frontier)
+            self._pocket_fields[ideal_tile] = field
+        return field
+
+    def _search_pocket(self, start):
+        """Finds the best self destruct tile of the pocket around start, and remembers it for every tile in the pocket
+        """
+        blocked = self._blocked
+        idealness = _IDEALNESS[self.direction]
+        pocket = [start]
+        seen = {start}
+        for tile in pocket:
+            for neighbor in _NEIGHBORS[tile]:
+                if neighbor not in seen and not blocked[neighbor]:
+                    seen.add(neighbor)
+                    pocket.append(neighbor)
+        # Idealness is unique per tile, so the search order cannot change the winner
+        ideal_tile = max(pocket, key=idealness.__getitem__)
+        for tile in pocket:
+            self._pocket_ideal[tile] = ideal_tile
+        return ideal_tile
+
+
+class WallEffect:
+    """How placing a wall on one tile would change the paths of a set of mobile units
+
+    Attributes :
+        * location (list): The tile the wall would be placed on
+        * length_change (int): The change in the total number of tiles the units walk, summed over their paths
+        * exposure_change (float): The change in the total damage per frame of the defending structures covering
+          each step of the paths, as ThreatMap.path_damage counts it
+        * path_tiles (frozenset): Every (x, y) tile on at least one of the paths once the wall is placed
+        * changed_paths (int): The number of units whose path would change
+        * blocks_edge (int): The number of units that reach their edge now but would self destruct instead
+
+    """
+    def __init__(self, location, length_change, exposure_change, path_tiles, changed_paths, blocks_edge):
+        self.location = location
+        self.length_change = length_change
+        self.exposure_change = exposure_change
+        self.path_tiles = path_tiles
+        self.changed_paths = changed_paths
+        self.blocks_edge = blocks_edge
+
+    def __repr__(self):
+        return "WallEffect(location: {}, length_change: {}, exposure_change: {}, changed_paths: {}, blocks_edge: {})".format(
+            self.location, self.length_change, self.exposure_change, self.changed_paths, self.blocks_edge)
+
+
+class PathAtlas:
+    """The paths a player's mobile units would take from every open tile of that player's spawn edges
+
+    Attributes :
+        * player_index (int): The player whose units take the paths
+        * paths (dict): Maps every start location, as an (x, y) tuple, to its path
+        * traversals (list): The number of paths crossing each tile, indexed by x * 28 + y
+
+    """
+    def __init__(self, player_index, paths):
+        self.player_index = player_index
+        self.paths = paths
+        self.traversals = [0] * TILE_COUNT
+        for path in paths.values():
+            for tile in set(x * ARENA_SIZE + y for x, y in path):
+                self.traversals[tile] += 1
+
+    def traversals_at(self, location):
+        """Gets the number of paths crossing a tile
+
+        Args:
+            location: A map location
+
+        Returns:
+            The number of paths that cross location
+
+        """
+        return self.traversals[location[0] * ARENA_SIZE + location[1]]
+
+    def busiest(self, count=1, rows=None):
+        """Finds the tiles the most paths cross
+
+        Args:
+            * count: The number of tiles to return
+            * rows: Only consider tiles with a y in rows, such as range(14) for the bottom half. Every row by default.
+
+        Returns:
+            Up to count [x, y] locations crossed by at least one path, the busiest first
+
+        """
+        tiles = [tile for tile in range(TILE_COUNT) if self.traversals[tile] and (rows is None or tile % ARENA_SIZE in rows)]
+        tiles.sort(key=lambda tile: -self.traversals[tile])
+        return [[tile // ARENA_SIZE, tile % ARENA_SIZE] for tile in tiles[:count]]
+
+    def __repr__(self):
+        return "PathAtlas(player_index: {}, paths: {})".format(self.player_index, len(self.paths))
+
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,18 +570,29 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles pathfinding
 
+    Blocked state, visited flags and path lengths are kept in flat preallocated
+    arrays indexed by x * 28 + y, which are reused between calls.
+
     Attributes :
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
 
         * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * blocked (bytearray): 1 for every tile holding a structure
+        * pathlength (list): The distance between each tile and the target location, -1 if unreachable
 
     """
     def __init__(self):
-        self.HORIZONTAL = 1
-        self.VERTICAL = 2
+        self.HORIZONTAL = HORIZONTAL
+        self.VERTICAL = VERTICAL
         self.initialized = False
+        self.blocked = bytearray(TILE_COUNT)
+        self.pathlength = list(_UNVISITED)
+        self._visited = bytearray(TILE_COUNT)
+        self._frontier = deque()
+        self._synced_map = None
+        self._synced_version = -1
+        self._fingerprint = None
 
     def initialize_map(self, game_state):
         """Initializes the map
@@ -47,10 +600,35 @@ class ShortestPathFinder:
         Args:
             game_state: A GameState object representing the gamestate we want to traverse
         """
-        #Initialize map 
+        #Initialize map
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self.pathlength[:] = _UNVISITED
+        self._visited[:] = _CLEAR
+        self._sync_blocked(game_state.game_map)
+
+    def layout_fingerprint(self, game_state):
+        """Identifies the current structure layout
+
+        Args:
+            game_state: The game state whose layout we want
+
+        Returns:
+            The bytes of the blocked-tile bitmap. Equal layouts always have equal fingerprints.
+
+        """
+        self._sync_blocked(game_state.game_map)
+        return self._fingerprint
+
+    def _sync_blocked(self, game_map):
+        """Copies the game map's blocked map, unless it is unchanged since the last copy
+        """
+        if game_map is self._synced_map and game_map._layout_version == self._synced_version:
+            return
+        self.blocked[:] = game_map.blocked
+        self._synced_map = game_map
+        self._synced_version = game_map._layout_version
+        self._fingerprint = bytes(self.blocked)
 
     def navigate_multiple_endpoints(self, start_point, end_points, game_state):
         """Finds the path a unit would take to reach a set of endpoints
@@ -68,226 +646,76 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
+        #Initialize map and fill in walls
         self.initialize_map(game_state)
-        #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
         #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
+        start = start_point[0] * ARENA_SIZE + start_point[1]
+        ends = [x * ARENA_SIZE + y for x, y in end_points]
+        direction = self._get_direction_from_endpoints(end_points)
+        ideal_endpoint = self._idealness_search(start, ends, direction)
+        self._validate(ideal_endpoint, ends)
+        return self._get_path(start_point, direction)
 
-    def _idealness_search(self, start, end_points):
+    def _idealness_search(self, start, ends, direction):
         """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
+        Finds the most ideal tile in our 'pocket' of pathable space.
         The edge if it is available, or the best self destruct location otherwise
         """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
+        end_set = set(ends)
+        if start in end_set:
+            return start
+
+        blocked = self.blocked
+        visited = self._visited
+        idealness = _IDEALNESS[direction]
+        current = self._frontier
+        current.clear()
+        current.append(start)
+        visited[start] = 1
+        best_idealness = idealness[start]
         most_ideal = start
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        while current:
+            for neighbor in _NEIGHBORS[current.popleft()]:
+                if visited[neighbor] or blocked[neighbor]:
                     continue
-
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
-
-                if current_idealness > best_idealness:
-                    best_idealness = current_idealness
+                # Nothing beats an endpoint, so the rest of the pocket does not matter
+                if neighbor in end_set:
+                    return neighbor
+                visited[neighbor] = 1
+                if idealness[neighbor] > best_idealness:
+                    best_idealness = idealness[neighbor]
                     most_ideal = neighbor
-
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
+                current.append(neighbor)
 
         return most_ideal
 
-    def _get_neighbors(self, location):
-        """Get the locations adjacent to a location
-        """
-        x, y = location
-        return [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]
-
     def _get_direction_from_endpoints(self, end_points):
-        """Prints a message to the games debug output
+        """Gets the direction of an edge
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
+            * end_points: A set of endpoints, should be an edge
 
         Returns:
-            A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
-
-        """
-        point = end_points[0]
-        x, y = point
-        direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
-           direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
-            direction[1] = -1
-        return direction
-
-    def _get_idealness(self, location, end_points):
-        """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
+            A direction (x, y) representing the edge. For example, (1, 1) for the top right and (-1, 1) for the top left
 
-        Returns:
-            A location the unit will attempt to reach
         """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
+        return _direction_from_endpoints(end_points)
 
-        idealness = 0
-        if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
-
-    def _validate(self, ideal_tile, end_points):
+    def _validate(self, ideal_tile, ends):
         """Breadth first search of the grid, setting the pathlengths of each node
 
         """
         #VALDIATION
         #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
-        else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                    continue
+        seeds = ends if ideal_tile in ends else [ideal_tile]
+        _flood(self.blocked, seeds, self.pathlength, self._frontier)
 
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
-
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
-
-    def _get_path(self, start_point, end_points):
+    def _get_path(self, start_point, direction):
         """Once all nodes are validated, and a target is found, the unit can path to its target
 
         """
-        #GET THE PATH
-        path = [start_point]
-        current = start_point
-        move_direction = 0
-
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
-
-            if current[0] == next_move[0]:
-                move_direction = self.VERTICAL
-            else:
-                move_direction = self.HORIZONTAL
-            path.append(next_move)
-            current = next_move
-        
-        #debug_write(path)
-        return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
-        """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
-        """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
-
-        ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
-                continue
-
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
-
-            #Filter by pathlength
-            if current_pathlength > best_pathlength:
-                continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
-
-            #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
-                continue
-
-            ideal_neighbor = neighbor
-            best_pathlength = current_pathlength
-
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
-        return ideal_neighbor
-
-    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
-        """Compare two tiles and return True if the unit would rather move to the new one
-
-        """
-        #True if we are moving in a different direction than prev move and prev is not
-        #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
-        if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
-            #We want to go up now. If we have not changed our y, we are not going up
-            if prev_tile[1] == new_tile[1]:
-                return False 
-            return True
-        if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
-            if prev_tile[0] == new_tile[0]:
-                #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
-                return False
-            return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
-                return False
-            return True
-        
-        #To make it here, both moves are on the same axis 
-        direction = self._get_direction_from_endpoints(end_points)
-        if new_tile[1] == prev_best[1]: #If they both moved horizontal...
-            if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
-            if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
-        if new_tile[0] == prev_best[0]: #If they both moved vertical...
-            if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
-                return True
-            if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
-                return True
-            return False
-        return True
+        return _walk(start_point, direction, self.blocked, self.pathlength)
 
     def print_map(self):
         """Prints an ASCII version of the current game map for debug purposes
@@ -299,9 +727,9 @@ class ShortestPathFinder:
 
         for y in range(28):
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                index = x * ARENA_SIZE + 28 - y - 1
+                if not self.blocked[index] and not self.pathlength[index] == -1:
+                    self._print_justified(self.pathlength[index])
                 else:
                     sys.stderr.write("   ")
             debug_write("")
@@ -0,0 +1,194 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from .game_state import GameState
+from .game_map import GameMap
+from .simulator import Simulator
+from .unit import UnitTypeTable
+from .unit_store import _REMOVE_INDEX, _UPGRADE_INDEX
+from .budget import TurnBudget
+from .util import debug_write
+
+# Options are split into this many chunks per worker, so a budget running out loses little finished work
+_CHUNKS_PER_WORKER = 4
+
+# Set in each worker process by _start_worker
+_worker_config = None
+_worker_board = None
+
+
+def compact_state(game_state, structures=True):
+    """Packs the units, health and resources of a game state into the dict form GameState parses.
+    Queued deployments are not included.
+
+    Args:
+        * game_state: The GameState to pack
+        * structures: Whether to include structures, or only mobile units
+
+    Returns:
+        A dict that GameState(config, dict) turns back into an equivalent state
+
+    """
+    unit_information = game_state.config["unitInformation"]
+    type_index = UnitTypeTable.for_config(game_state.config).type_index
+    units = [[[] for _ in unit_information], [[] for _ in unit_information]]
+    game_map = game_state.game_map
+    for x, y in game_map:
+        for unit in game_map._units_at(x, y):
+            if unit.stationary and not structures:
+                continue
+            player_units = units[unit.player_index]
+            player_units[type_index[unit.unit_type]].append([x, y, unit.health, ""])
+            if unit.pending_removal:
+                player_units[_REMOVE_INDEX].append([x, y, 0, ""])
+            if unit.upgraded:
+                player_units[_UPGRADE_INDEX].append([x, y, 0, ""])
+    resources = game_state._player_resources
+    return {
+        "turnInfo": [0, game_state.turn_number, -1],
+        "p1Stats": [game_state.my_health, resources[0]["SP"], resources[0]["MP"], game_state.my_time],
+        "p2Stats": [game_state.enemy_health, resources[1]["SP"], resources[1]["MP"], game_state.enemy_time],
+        "p1Units": units[0],
+        "p2Units": units[1],
+    }
+
+
+def _start_worker(config):
+    global _worker_config
+    _worker_config = config
+    UnitTypeTable.for_config(config)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _pack_board(game_state):
+    """Packs a state for the workers: the structures with GameMap.to_bytes, and the mobile units,
+    health and resources with compact_state.
+    """
+    return game_state.game_map.to_bytes(), compact_state(game_state, structures=False)
+
+
+def _unpack_board(config, packed_board):
+    """Rebuilds a GameState from _pack_board's output
+    """
+    structures, state = packed_board
+    game_state = GameState(config, state)
+    structure_map = GameMap.from_bytes(config, structures)
+    for x, y in structure_map:
+        for unit in structure_map._units_at(x, y):
+            game_state.game_map._append_unit(unit)
+    return game_state
+
+
+def _simulate_chunk(board_id, packed_board, deployment_options, deadline):
+    """Runs in a worker. Simulates a chunk of options until the deadline, a time.monotonic() reading or None.
+    The board is rebuilt only when it changed since the worker's last chunk.
+
+    Returns the results of the options simulated before the deadline, in order.
+    """
+    global _worker_board
+    if deadline is not None and time.monotonic() >= deadline:
+        return []
+    if _worker_board is None or _worker_board[0] != board_id:
+        game_state = _unpack_board(_worker_config, packed_board)
+        game_state.suppress_warnings(True)
+        _worker_board = (board_id, Simulator(game_state))
+    budget = None if deadline is None else TurnBudget(deadline - time.monotonic()).start()
+    results = _worker_board[1].simulate_many(deployment_options, budget)
+    for result in results:
+        # The final state is large and stays in the worker
+        result.state = None
+    return results
+
+
+class ParallelEvaluator:
+    """Simulates many candidate deployments at once on a pool of worker processes
+
+    The workers are started once and keep the config and unit stat tables loaded for the
+    whole game. For each evaluate call the board is packed once: the structures into the fixed size
+    GameMap.to_bytes buffer, and the few mobile units and the resources with compact_state. The
+    options are split into a few small chunks per worker. Each chunk carries the packed board, a few
+    kilobytes, and every worker rebuilds the board once, for the first of its chunks. Workers stop starting simulations when the budget runs
+    out, so a short budget still returns every option finished by then.
+    Only the summary numbers of each SimulationResult come back; result.state is None.
+
+    Attributes :
+        * workers (int): The number of worker processes
+
+    """
+    def __init__(self, config, workers=None):
+        """Sets up the pool. Worker processes start when first needed, or when warm_up is called.
+
+        Args:
+            * config (JSON): Contains information about the game
+            * workers: The number of worker processes, one per CPU by default
+
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_start_worker, initargs=(config,))
+        self._board_id = 0
+
+    def warm_up(self):
+        """Starts every worker now, so the first evaluate call does not pay for it
+        """
+        wait([self._pool.submit(_warm_up) for _ in range(self.workers)])
+
+    def evaluate(self, game_state, deployment_options, budget=None, transpositions=None):
+        """Simulates every deployment option on the given state
+
+        Args:
+            * game_state: The state to simulate from
+            * deployment_options: A list of deployment lists, each in the form Simulator.simulate takes
+            * budget: A TurnBudget. Workers stop when it runs out, and options they had not finished are dropped.
+            * transpositions: A TranspositionTable. Options found in it are not sent to the workers, and new results are added to it.
+
+        Returns:
+            A list with a SimulationResult for every option, or None for options dropped because time ran out
+            or because their worker failed
+
+        """
+        results = [None] * len(deployment_options)
+        pending = list(range(len(deployment_options)))
+        if transpositions is not None:
+            board_key = transpositions.board_key(game_state)
+            for index, deployments in enumerate(deployment_options):
+                results[index] = transpositions.get(board_key, deployments)
+            pending = [index for index in pending if results[index] is None]
+        if not pending:
+            return results
+
+        self._board_id += 1
+        packed_board = _pack_board(game_state)
+        deadline = None if budget is None else time.monotonic() + max(budget.remaining(), 0)
+        chunk_size = max(1, -(-len(pending) // (self.workers * _CHUNKS_PER_WORKER)))
+        chunks = [pending[start:start + chunk_size] for start in range(0, len(pending), chunk_size)]
+        futures = [self._pool.submit(_simulate_chunk, self._board_id, packed_board, [deployment_options[index] for index in chunk], deadline)
+                   for chunk in chunks]
+        wait(futures, timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+
+        for chunk, future in zip(chunks, futures):
+            # Chunks not started yet are cancelled. Running ones stop by themselves at the deadline.
+            if not future.done():
+                future.cancel()
+                continue
+            if future.cancelled():
+                continue
+            try:
+                chunk_results = future.result()
+            except Exception:
+                debug_write("A parallel simulation failed:\n{}".format(traceback.format_exc()))
+                continue
+            for index, result in zip(chunk, chunk_results):
+                results[index] = result
+                if transpositions is not None:
+                    transpositions.put(board_key, deployment_options[index], result)
+        return results
+
+    def close(self):
+        """Stops the worker processes
+        """
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,113 @@
+from .game_map import ARENA_SIZE, _tiles_in_range
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Padding index for path arrays. It points one past the last tile, at an entry that is always zero.
+_PAD = ARENA_SIZE * ARENA_SIZE
+
+
+def shield_sources(game_map, player_index):
+    """Gets the supports that would shield a player's mobile units
+
+    Args:
+        * game_map: The GameMap to search
+        * player_index: The player whose units are shielded, 0 for you 1 for the enemy
+
+    Returns:
+        A list of (shield amount, tile indices in range, support unit) triples, one per support. Tiles are indexed by x * 28 + y.
+        The supports are read without copying shared tiles, so on a fork they may still belong to the original map.
+
+    """
+    sources = []
+    structures = game_map.player_structures[player_index]
+    for index, present in enumerate(structures):
+        if not present:
+            continue
+        x, y = divmod(index, ARENA_SIZE)
+        for unit in game_map._units_at(x, y):
+            if unit.stationary and unit.shieldPerUnit > 0 and unit.shieldRange > 0:
+                # The bonus grows as supports are placed further forward from their owner's edge
+                forward = y if player_index == 0 else ARENA_SIZE - 1 - y
+                sources.append((unit.shieldPerUnit + unit.shieldBonusPerY * forward, _tiles_in_range(unit.shieldRange, 0, x, y, True), unit))
+    return sources
+
+
+def path_indices(paths):
+    """Packs paths into a padded rectangle of tile indices
+
+    Args:
+        paths: A list of paths, each a list of locations
+
+    Returns:
+        A list of equal length lists of tile indices, padded past the end of shorter paths
+
+    """
+    longest = max((len(path) for path in paths), default=0)
+    return [[x * ARENA_SIZE + y for x, y in path] + [_PAD] * (longest - len(path)) for path in paths]
+
+
+def score_paths(game_state, paths, player_index=0, frames_per_tile=1, use_numpy=None):
+    """Scores many candidate paths for a player's mobile units in one call
+
+    Uses NumPy when it is installed, and plain Python otherwise. Both give the same results.
+
+    Args:
+        * game_state: The current GameState
+        * paths: A list of paths, each a list of locations such as one returned by find_path_to_edge
+        * player_index: The player whose units walk the paths, 0 for you 1 for the enemy
+        * frames_per_tile: The number of frames a unit spends on each tile, 1 / speed
+        * use_numpy: Force NumPy on or off. Defaults to using it when available.
+
+    Returns:
+        Three lists with one entry per path: the damage structures deal along the path,
+        the number of frames spent in range of at least one structure, and the shielding
+        friendly supports would grant along the path
+
+    """
+    if not paths:
+        return [], [], []
+    threat = game_state.threat_map(player_index)
+    sources = shield_sources(game_state.game_map, player_index)
+    indices = path_indices(paths)
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if use_numpy:
+        return _score_numpy(indices, threat, sources, frames_per_tile)
+    return _score_python(indices, threat, sources, frames_per_tile)
+
+
+def _score_python(indices, threat, sources, frames_per_tile):
+    damage = threat.damage + [0.0]
+    attackers = threat.attackers + [0]
+    damages = []
+    frames = []
+    shielding = []
+    for path in indices:
+        damages.append(sum(damage[tile] for tile in path) * frames_per_tile)
+        frames.append(sum(1 for tile in path if attackers[tile]) * frames_per_tile)
+        tiles = set(path)
+        shielding.append(sum(amount for amount, covered, _ in sources if not tiles.isdisjoint(covered)))
+    return damages, frames, shielding
+
+
+def _score_numpy(indices, threat, sources, frames_per_tile):
+    indices = numpy.array(indices, dtype=numpy.intp)
+    damage = numpy.zeros(_PAD + 1)
+    damage[:_PAD] = threat.damage
+    threatened = numpy.zeros(_PAD + 1)
+    threatened[:_PAD] = numpy.array(threat.attackers) > 0
+
+    damages = damage[indices].sum(axis=1) * frames_per_tile
+    frames = threatened[indices].sum(axis=1) * frames_per_tile
+    if sources:
+        coverage = numpy.zeros((_PAD + 1, len(sources)), dtype=bool)
+        for column, (_, covered, _) in enumerate(sources):
+            coverage[covered, column] = True
+        amounts = numpy.array([source[0] for source in sources])
+        shielding = coverage[indices].any(axis=1) @ amounts
+    else:
+        shielding = numpy.zeros(len(indices))
+    return damages.tolist(), frames.tolist(), shielding.tolist()
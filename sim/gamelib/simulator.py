@@ -0,0 +1,286 @@
+from .game_map import ARENA_SIZE, HALF_ARENA, ARENA_LOCATIONS, _tiles_in_range
+from .navigation import HORIZONTAL, VERTICAL
+from .scoring import shield_sources
+
+
+class SimulationResult:
+    """The outcome of a simulated action phase
+
+    Every per player list is indexed by the player that did the scoring or the damage, 0 for you 1 for the enemy.
+
+    Attributes :
+        * frames (int): The number of frames simulated
+        * breaches (list): The number of units each player got to its target edge
+        * breach_damage (list): The health damage those breaches dealt to the opponent
+        * structure_damage (list): The damage each player dealt to enemy structures
+        * unit_damage (list): The damage each player dealt to enemy mobile units
+        * self_destructs (list): The number of each player's units that self destructed with enough steps to explode
+        * units_lost (list): The number of each player's mobile units destroyed before reaching an edge
+        * destroyed (list): (unit_type, player_index, x, y) for every structure destroyed
+        * state (:obj: GameState): The simulation's fork of the game state, as it was when the simulation ended
+
+    """
+    def __init__(self):
+        self.frames = 0
+        self.breaches = [0, 0]
+        self.breach_damage = [0, 0]
+        self.structure_damage = [0, 0]
+        self.unit_damage = [0, 0]
+        self.self_destructs = [0, 0]
+        self.units_lost = [0, 0]
+        self.destroyed = []
+        self.state = None
+
+    def __repr__(self):
+        return "SimulationResult(frames: {}, breaches: {}, structure_damage: {}, destroyed: {})".format(
+            self.frames, self.breaches, self.structure_damage, len(self.destroyed))
+
+
+class _Walker:
+    """A mobile unit taking part in a simulation
+    """
+    __slots__ = ["unit", "target_edge", "progress", "steps", "move_direction", "shielded_by"]
+
+    def __init__(self, unit, target_edge):
+        self.unit = unit
+        self.target_edge = target_edge
+        self.progress = 0
+        self.steps = 0
+        self.move_direction = 0
+        self.shielded_by = set()
+
+
+class Simulator:
+    """Simulates the action phase of a turn
+
+    Each frame follows the engine's order: supports shield mobile units entering their range,
+    mobile units move at their speed, every unit attacks the target get_target picks for it,
+    and anything left with no health is removed. Units that reach their target edge breach.
+    Units that reach the end of a path that does not touch the edge self destruct, damaging
+    nearby enemies if they walked far enough. Units repath whenever a structure is destroyed.
+
+    The state passed in is never changed, every simulation runs on its own fork of it.
+
+    Attributes :
+        * game_state (:obj: GameState): The state simulations start from
+        * max_frames (int): Simulations stop after this many frames even if units are still moving
+        * transpositions (:obj: TranspositionTable): Where results are looked up before simulating and stored after, or None
+
+    """
+    def __init__(self, game_state, max_frames=1000, transpositions=None):
+        """Sets up a simulator for a game state
+
+        Args:
+            * game_state: The state simulations start from
+            * max_frames: The frame limit for each simulation
+            * transpositions: A TranspositionTable to reuse earlier results from. Results found there have no state.
+
+        """
+        self.game_state = game_state
+        self.max_frames = max_frames
+        self.transpositions = transpositions
+        self._unit_information = {}
+        for unit_information in game_state.config["unitInformation"]:
+            self._unit_information[unit_information.get("shorthand")] = unit_information
+        self._hit_radius = game_state.config["unitInformation"][0].get("getHitRadius", 0)
+        self._edge_tiles = [set(x * ARENA_SIZE + y for x, y in edge) for edge in game_state.game_map.get_edges()]
+
+    def simulate(self, deployments):
+        """Simulates the action phase after the given units are deployed
+
+        Mobile units already on the board take part too, heading for the edge opposite their location.
+
+        Args:
+            deployments: A list of (unit_type, location) or (unit_type, location, count) entries. Units deployed
+                on the bottom half belong to you, units on the top half to your opponent. Structures are placed before
+                the action phase starts.
+
+        Returns:
+            A SimulationResult
+
+        """
+        if self.transpositions is None:
+            return self._run(deployments)
+        return self._run_cached(self.transpositions.board_key(self.game_state, self.max_frames), deployments)
+
+    def _run_cached(self, board_key, deployments):
+        result = self.transpositions.get(board_key, deployments)
+        if result is None:
+            result = self._run(deployments)
+            self.transpositions.put(board_key, deployments, result)
+        return result
+
+    def _run(self, deployments):
+        state = self.game_state.fork()
+        board = state.game_map
+        result = SimulationResult()
+        result.state = state
+
+        for deployment in deployments:
+            unit_type, location = deployment[0], deployment[1]
+            count = deployment[2] if len(deployment) > 2 else 1
+            player_index = 0 if location[1] < HALF_ARENA else 1
+            for _ in range(count):
+                board.add_unit(unit_type, location, player_index)
+
+        walkers = []
+        for x, y in ARENA_LOCATIONS:
+            if board.blocked[x * ARENA_SIZE + y] or not board._units_at(x, y):
+                continue
+            for unit in board[x, y]:
+                if not unit.stationary:
+                    walkers.append(_Walker(unit, state.get_target_edge([x, y])))
+
+        # The attacking structures covering each tile, found with the same range check get_target uses.
+        # Reading every structure through board[x, y] gives the fork its own copies, which the simulation can
+        # damage, so the read-only lookups below (shield sources, get_target) see the same units.
+        turrets_at = {}
+        for x, y in ARENA_LOCATIONS:
+            if board.blocked[x * ARENA_SIZE + y]:
+                for unit in board[x, y]:
+                    if unit.stationary and unit.damage_i + unit.damage_f > 0:
+                        for tile in _tiles_in_range(unit.attackRange, self._hit_radius, x, y):
+                            turrets_at.setdefault(tile, []).append(unit)
+
+        shields = [shield_sources(board, 0), shield_sources(board, 1)]
+        shields_at = [{}, {}]
+        for player_index in range(2):
+            for source, (_, tiles, _) in enumerate(shields[player_index]):
+                for tile in tiles:
+                    shields_at[player_index].setdefault(tile, []).append(source)
+
+        while walkers and result.frames < self.max_frames:
+            result.frames += 1
+            self._shield(walkers, shields, shields_at)
+            walkers = self._move(state, walkers, result)
+            self._attack(state, walkers, turrets_at, result)
+            walkers = self._remove_dead(board, walkers, result)
+        return result
+
+    def simulate_many(self, deployment_options, budget=None):
+        """Simulates several alternative deployments, stopping early if time runs out
+
+        Args:
+            * deployment_options: A list of deployment lists, each in the form simulate takes
+            * budget: A TurnBudget. Once it expires no more options are simulated. The first option always is.
+
+        Returns:
+            A list of SimulationResults for the options that were simulated, in the same order
+
+        """
+        if budget is not None:
+            deployment_options = budget.iterate(deployment_options)
+        if self.transpositions is None:
+            return [self._run(deployments) for deployments in deployment_options]
+        board_key = self.transpositions.board_key(self.game_state, self.max_frames)
+        return [self._run_cached(board_key, deployments) for deployments in deployment_options]
+
+    def _shield(self, walkers, shields, shields_at):
+        for walker in walkers:
+            unit = walker.unit
+            for source in shields_at[unit.player_index].get(unit.x * ARENA_SIZE + unit.y, ()):
+                amount, _, support = shields[unit.player_index][source]
+                if source not in walker.shielded_by and support.health > 0:
+                    walker.shielded_by.add(source)
+                    unit.health += amount
+
+    def _move(self, state, walkers, result):
+        board = state.game_map
+        moving = []
+        for walker in walkers:
+            unit = walker.unit
+            walker.progress += unit.speed
+            if walker.progress < 1:
+                moving.append(walker)
+                continue
+            walker.progress -= 1
+
+            step = state.path_field(walker.target_edge).next_step([unit.x, unit.y], walker.move_direction)
+            if step is None:
+                if unit.x * ARENA_SIZE + unit.y in self._edge_tiles[walker.target_edge]:
+                    self._breach(walker, result)
+                else:
+                    self._self_destruct(board, walker, result)
+                board[unit.x, unit.y].remove(unit)
+                continue
+
+            walker.move_direction = VERTICAL if step[0] == unit.x else HORIZONTAL
+            walker.steps += 1
+            board[unit.x, unit.y].remove(unit)
+            unit.x, unit.y = step
+            if step[0] * ARENA_SIZE + step[1] in self._edge_tiles[walker.target_edge]:
+                self._breach(walker, result)
+                continue
+            board[step].append(unit)
+            moving.append(walker)
+        return moving
+
+    def _breach(self, walker, result):
+        player_index = walker.unit.player_index
+        result.breaches[player_index] += 1
+        result.breach_damage[player_index] += self._unit_information[walker.unit.unit_type].get("playerBreachDamage", 1)
+
+    def _self_destruct(self, board, walker, result):
+        unit = walker.unit
+        unit_information = self._unit_information[unit.unit_type]
+        if walker.steps < unit_information.get("selfDestructStepsRequired", 5):
+            return
+        result.self_destructs[unit.player_index] += 1
+        for location in board.get_locations_in_range([unit.x, unit.y], unit_information.get("selfDestructRange", 1.5)):
+            for target in board[location]:
+                if target.player_index == unit.player_index:
+                    continue
+                if target.stationary:
+                    damage = unit_information.get("selfDestructDamageTower", unit.max_health)
+                else:
+                    damage = unit_information.get("selfDestructDamageWalker", unit.max_health)
+                self._damage(target, damage, unit.player_index, result)
+
+    def _attack(self, state, walkers, turrets_at, result):
+        # Targets are all picked before any damage is dealt, attacks in a frame are simultaneous
+        attackers = [walker.unit for walker in walkers]
+        turrets = {}
+        for walker in walkers:
+            for turret in turrets_at.get(walker.unit.x * ARENA_SIZE + walker.unit.y, ()):
+                if turret.player_index != walker.unit.player_index and turret.health > 0:
+                    turrets[id(turret)] = turret
+        attackers.extend(turrets.values())
+
+        attacks = []
+        for attacker in attackers:
+            target = state.get_target(attacker)
+            if target is not None:
+                attacks.append((attacker, target))
+        for attacker, target in attacks:
+            damage = attacker.damage_f if target.stationary else attacker.damage_i
+            self._damage(target, damage, attacker.player_index, result)
+
+    def _damage(self, target, damage, player_index, result):
+        dealt = min(damage, max(target.health, 0))
+        target.health -= damage
+        if target.stationary:
+            result.structure_damage[player_index] += dealt
+        else:
+            result.unit_damage[player_index] += dealt
+
+    def _remove_dead(self, board, walkers, result):
+        alive = []
+        for walker in walkers:
+            unit = walker.unit
+            if unit.health > 0:
+                alive.append(walker)
+            else:
+                result.units_lost[unit.player_index] += 1
+                board[unit.x, unit.y].remove(unit)
+        for player_index in range(2):
+            structures = board.player_structures[player_index]
+            for index, present in enumerate(structures):
+                if not present:
+                    continue
+                x, y = divmod(index, ARENA_SIZE)
+                for unit in board[x, y]:
+                    if unit.stationary and unit.health <= 0:
+                        result.destroyed.append((unit.unit_type, unit.player_index, x, y))
+                        board.remove_unit([x, y])
+                        break
+        return alive
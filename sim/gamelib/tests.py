@@ -1,11 +1,30 @@
 import unittest
 import json
+import io
+import sys
+import time
 from .game_state import GameState
-from .unit import GameUnit
+from .unit import GameUnit, UnitTypeTable
+from .game_map import GameMap, ARENA_LOCATIONS, ARENA_NEIGHBORS, _tiles_in_range
+from .navigation import ShortestPathFinder, PathField
+from . import scoring
+from .simulator import Simulator
+from .unit_store import UnitStore
+from .util import decode_json, peek_json
+from .algocore import AlgoCore
+from .budget import TurnBudget
+from .parallel import ParallelEvaluator, compact_state, _pack_board, _unpack_board
+from .transposition import TranspositionTable, canonical_deployments
+
+
+def count_structures(game_state):
+    """A speculative planner for test_speculative_plan. It has to be module level to be sent to another process.
+    """
+    return (game_state.turn_number, sum(1 for location in game_state.game_map if game_state.contains_stationary_unit(location)), game_state.get_resources(0))
 
 class BasicTests(unittest.TestCase):
 
-    def make_turn_0_map(self):
+    def make_turn_0_map(self, unit_overrides=None):
         config = """
             {
             "seasonCompatibilityModeP1": 5,
@@ -188,7 +207,10 @@ class BasicTests(unittest.TestCase):
         """
         turn_0 = """{"p2Units":[[],[],[],[],[],[],[]],"turnInfo":[0,0,-1],"p1Stats":[30.0,25.0,5.0,0],"p1Units":[[],[],[],[],[],[],[]],"p2Stats":[30.0,25.0,5.0,0],"events":{"selfDestruct":[],"breach":[],"damage":[],"shield":[],"move":[],"spawn":[],"death":[],"attack":[],"melee":[]}}"""
         
-        state = GameState(json.loads(config), turn_0)
+        config = json.loads(config)
+        for index, overrides in (unit_overrides or {}).items():
+            config["unitInformation"][index].update(overrides)
+        state = GameState(config, turn_0)
         state.suppress_warnings(True)
         return state
 
@@ -239,6 +261,13 @@ class BasicTests(unittest.TestCase):
         game = self.make_turn_0_map()
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3.5)), "Wrong number of tiles in range")
+        self.assertEqual(5, len(game.game_map.get_locations_in_range([13,0], 1.5)), "Range should be clipped to the arena")
+        game.game_map.get_locations_in_range([13,13], 3.5)[0].append("junk")
+        self.assertEqual([10, 12], game.game_map.get_locations_in_range([13,13], 3.5)[0], "Cached stencils should not be shared with callers")
+        self.assertEqual([x * 28 + y for x, y in game.game_map.get_locations_in_range([13,0], 3.5)], list(_tiles_in_range(3.5, 0, 13, 0)),
+                         "Tile indices should cover the same locations as get_locations_in_range")
+        self.assertEqual((9, 13), (len(_tiles_in_range(2.0, 0, 13, 13)), len(_tiles_in_range(2.0, 0, 13, 13, True))),
+                         "Inclusive ranges should cover tiles exactly at the range")
 
     def _test_get_attackers(self):
         game = self.make_turn_0_map()
@@ -256,6 +285,546 @@ class BasicTests(unittest.TestCase):
         game.game_map.add_unit("DF", [14,14], 1)
         self.assertEqual(3, len(game.get_attackers([13,13], 0)), "We should be in danger from 3 places")
 
+    def test_pathing(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        self.assertEqual([13, 0], path[0], "Path should begin at the start location")
+        self.assertIn(path[-1], game.game_map.get_edge_locations(game.game_map.TOP_RIGHT), "Path should end on the target edge")
+        for step, next_step in zip(path, path[1:]):
+            self.assertEqual(1, abs(step[0] - next_step[0]) + abs(step[1] - next_step[1]), "Path steps should be adjacent")
+
+        game.game_map.add_unit("FF", [13, 1])
+        game.game_map.add_unit("FF", [14, 1])
+        self.assertEqual([[13, 0], [14, 0]], game.find_path_to_edge([13, 0]), "Trapped unit should walk to the best self destruct tile")
+        self.assertEqual(None, game.find_path_to_edge([13, 1]), "Pathing from a blocked tile should fail")
+
+    def test_path_cache(self):
+        game = self.make_turn_0_map()
+        path = game.find_path_to_edge([13, 0])
+        path[1].append("junk")
+        self.assertEqual(game.find_path_to_edge([13, 0])[1], [13, 1], "Cached paths should not be shared with callers")
+
+        game.attempt_spawn("FF", [13, 1])
+        self.assertNotIn([13, 1], game.find_path_to_edge([13, 0]), "Spawning a wall should invalidate cached paths")
+        game.game_map.remove_unit([13, 1])
+        self.assertEqual(game.find_path_to_edge([13, 0])[1], [13, 1], "Removing a wall should invalidate cached paths")
+
+    def test_path_field(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 1])
+        game.game_map.add_unit("FF", [14, 1])
+        field = game.path_field(game.game_map.TOP_RIGHT)
+        self.assertEqual(False, field.reaches_edge([13, 0]), "Walled in tiles should not reach the edge")
+        self.assertEqual(True, field.reaches_edge([12, 1]), "Open tiles should reach the edge")
+        self.assertEqual([[13, 0], [14, 0]], field.path_from([13, 0]), "Walled in units should self destruct")
+        self.assertEqual(None, field.path_from([13, 1]), "Blocked tiles have no path")
+        for start in [[12, 1], [5, 8], [13, 0], [14, 0]]:
+            expected = game._shortest_path_finder.navigate_multiple_endpoints(start, field.end_points, game)
+            self.assertEqual(expected, field.path_from(start), "Field paths should match the pathfinder")
+        self.assertIs(field, game.path_field(game.game_map.TOP_RIGHT), "Fields should be reused while the layout is unchanged")
+
+    def test_batch_pathing(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 1])
+        starts = [[13, 0], [14, 0], [3, 10], [24, 10], [13, 1]]
+        paths = game.find_paths_to_edges(starts)
+        self.assertEqual(sorted(map(tuple, starts)), sorted(paths.keys()), "Every start should get an entry")
+        self.assertEqual(None, paths[13, 1], "Blocked starts have no path")
+        for start in starts[:4]:
+            self.assertEqual(game.find_path_to_edge(start), paths[tuple(start)], "Batch paths should match single queries")
+        paths = game.find_paths_to_edges(starts[:2], game.game_map.BOTTOM_LEFT)
+        self.assertIn(paths[14, 0][-1], game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT), "Explicit edges should override the induced ones")
+
+    def test_blocked_map(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        game_map.add_unit("FF", [13, 13], 0)
+        game_map.add_unit("DF", [14, 14], 1)
+        game_map.add_unit("EI", [12, 12], 0)
+        self.assertEqual([13 * 28 + 13, 14 * 28 + 14], [i for i, b in enumerate(game_map.blocked) if b], "Only structures should block")
+        self.assertEqual(1, game_map.player_structures[0][13 * 28 + 13], "Friendly structure missing")
+        self.assertEqual(1, game_map.player_structures[1][14 * 28 + 14], "Enemy structure missing")
+        self.assertEqual(0, game_map.player_structures[0][14 * 28 + 14], "Enemy structure marked as friendly")
+
+        game_map.remove_unit([13, 13])
+        self.assertEqual(False, game.contains_stationary_unit([13, 13]), "Removed structures should not block")
+        game_map[12, 12].append(GameUnit("FF", game.config, 0, None, 12, 12))
+        game_map.invalidate_layout()
+        self.assertEqual(1, game_map.blocked[12 * 28 + 12], "invalidate_layout should pick up direct edits")
+        self.assertEqual("FF", game.contains_stationary_unit([12, 12]).unit_type, "Structure should be found after invalidate_layout")
+
+        layout_version = game_map._layout_version
+        self.assertEqual(1, game.attempt_remove([12, 12]), "Friendly structures should be flagged for removal")
+        self.assertEqual((layout_version, 1), (game_map._layout_version, game_map.blocked[12 * 28 + 12]),
+                         "A queued removal should not change the layout")
+
+    def test_arena_tables(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(420, len(ARENA_LOCATIONS), "The arena should have 420 tiles")
+        self.assertEqual([list(location) for location in ARENA_LOCATIONS], list(game.game_map), "Iteration should follow the location table")
+        self.assertEqual((13 * 28 + 1, 14 * 28 + 0), ARENA_NEIGHBORS[13 * 28 + 0], "Corner tiles should only have in-bounds neighbors")
+        self.assertEqual(False, game.game_map.in_arena_bounds([0, 0]), "Corners of the square are outside the diamond")
+        self.assertEqual(True, game.game_map.in_arena_bounds([13.0, 0.0]), "Float locations should still be accepted")
+
+    def test_threat_map(self):
+        game = self.make_turn_0_map()
+        threat = game.threat_map(0)
+        self.assertEqual(0, threat.attackers_at([13, 13]), "Are we being threatened by a ghost?")
+        game.game_map.add_unit("DF", [12, 12], 0)
+        game.game_map.add_unit("EF", [13, 12], 1)
+        self.assertEqual(0, threat.attackers_at([13, 13]), "Only enemy turrets should threaten us")
+        game.game_map.add_unit("DF", [12, 14], 1)
+        game.game_map.add_unit("DF", [14, 14], 1)
+        self.assertEqual(2, threat.attackers_at([13, 13]), "New turrets should be added to the threat map")
+        self.assertEqual(10, threat.damage_at([13, 13]), "Damage should add up")
+        self.assertEqual(1, game.threat_map(1).attackers_at([13, 14]), "Our turret should threaten the enemy")
+
+        game.game_map.remove_unit([12, 14])
+        self.assertEqual(1, threat.attackers_at([13, 13]), "Removed turrets should stop threatening")
+        game.game_map.upgrade_unit([14, 14])
+        self.assertEqual(15, threat.damage_at([13, 13]), "Upgrades should update damage")
+        self.assertEqual(1, threat.attackers_at([17, 14]), "Upgrades should update range")
+        self.assertEqual(30, threat.path_damage([[13, 13], [14, 13]]), "Path damage should sum the path")
+
+    def test_score_paths(self):
+        game = self.make_turn_0_map({1: {"shieldRange": 2.0, "shieldPerUnit": 3.0, "shieldBonusPerY": 0.5}})
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("EF", [10, 4], 0)
+        paths = [[[13, 12], [13, 13]], [[10, 3], [11, 3], [12, 3]], [[5, 10]]]
+        damages, frames, shielding = scoring.score_paths(game, paths, use_numpy=False)
+        self.assertEqual([10, 0, 0], damages, "Damage should sum the threat along each path")
+        self.assertEqual([4, 0, 0], scoring.score_paths(game, paths, frames_per_tile=2, use_numpy=False)[1], "Frames in range should scale with speed")
+        self.assertEqual([0, 5, 0], shielding, "Each support should shield a path once")
+        if scoring.numpy is not None:
+            self.assertEqual((damages, frames, shielding), scoring.score_paths(game, paths, use_numpy=True), "NumPy and Python scores should match")
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        result = Simulator(game).simulate([["PI", [13, 0], 2]])
+        self.assertEqual([2, 0], result.breaches, "Units on an empty board should all breach")
+        self.assertEqual([2.0, 0], result.breach_damage, "Each ping should deal its breach damage")
+        self.assertEqual(0, len(game.game_map[13, 0]), "Simulating should not change the game state")
+
+        game.game_map.add_unit("DF", [24, 14], 1)
+        result = Simulator(game).simulate([["PI", [13, 0]]])
+        self.assertEqual([0, 0], result.breaches, "The turret should kill a lone ping before it breaches")
+        self.assertEqual([1, 0], result.units_lost, "The ping should be counted as lost")
+        self.assertEqual([10.0, 0], result.structure_damage, "The ping should hit the turret until it dies")
+        self.assertEqual(90.0, game.game_map[24, 14][0].health, "Simulating should not damage the real turret")
+
+    def test_fork(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("PI", [13, 0], 0)
+        threat = game.threat_map(0)
+
+        fork = game.fork()
+        fork.game_map[13, 14][0].health = 1
+        fork.game_map.add_unit("PI", [13, 0], 0)
+        fork.game_map.add_unit("FF", [13, 13], 0)
+        fork.game_map.remove_unit([13, 14])
+        fork.attempt_spawn("FF", [10, 10])
+
+        self.assertEqual(90.0, game.game_map[13, 14][0].health, "Damaging a unit in a fork should not damage the original")
+        self.assertEqual(1, len(game.game_map[13, 0]), "Units added to a fork should not appear in the original")
+        self.assertEqual(2, len(fork.game_map[13, 0]), "The fork should see its own units")
+        self.assertEqual(0, game.game_map.blocked[13 * 28 + 13], "The original blocked map should be unchanged")
+        self.assertEqual(25, game.get_resource(game.SP), "Spending in a fork should not spend the original resources")
+        self.assertEqual(1, threat.attackers_at([13, 12]), "The original threat map should still see the turret")
+        self.assertEqual(0, fork.threat_map(0).attackers_at([13, 12]), "The forked threat map should follow the fork")
+        self.assertEqual(game.find_path_to_edge([13, 0]), game.fork().find_path_to_edge([13, 0]), "A fresh fork should path like the original")
+
+        reader = game.fork()
+        reader.get_target(reader.game_map[13, 0][0])
+        reader.get_attackers([13, 12], 0)
+        scoring.shield_sources(reader.game_map, 1)
+        self.assertEqual(1, reader.game_map._shared[13 * 28 + 14], "Read-only queries should not copy a fork's tiles")
+        result = Simulator(game).simulate([["PI", [13, 0], 5]])
+        self.assertEqual(90.0, game.game_map[13, 14][0].health, "Simulating should not damage the original's structures")
+
+    def test_edge_distances(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 1], 0)
+        distances = game.edge_distances()
+        self.assertEqual(4, len(distances), "There should be a field for every edge")
+        for edge in range(4):
+            self.assertEqual(ShortestPathFinder().navigate_multiple_endpoints([13, 0], game.game_map.get_edge_locations(edge), game),
+                             game.path_field(edge).path_from([13, 0]), "The stored fields should path like the pathfinder")
+        self.assertIs(distances[0], game.path_field(0).pathlength, "path_field should reuse the stored fields")
+        self.assertEqual(0, distances[game.game_map.BOTTOM_LEFT][13 * 28 + 0], "Edge tiles should be 0 steps from their edge")
+
+        game.game_map.add_unit("FF", [12, 0], 0)
+        game.game_map.add_unit("FF", [14, 0], 0)
+        self.assertEqual(False, game.can_reach_edge([13, 0]), "A walled in tile should not reach its edge")
+        self.assertEqual(-1, game.edge_distances()[game.game_map.TOP_RIGHT][13 * 28 + 0], "The fields should follow layout changes")
+        self.assertEqual(True, game.can_reach_edge([3, 10]), "Open tiles should still reach their edge")
+
+    def test_path_repair(self):
+        game = self.make_turn_0_map()
+        for x in range(3, 25):
+            game.game_map.add_unit("FF", [x, 11], 0)
+        edge = game.game_map.TOP_RIGHT
+        end_points = game.game_map.get_edge_locations(edge)
+        before = game.path_field(edge)
+        for location in [[10, 12], [3, 10], [13, 11], [24, 11], [13, 0]]:
+            if game.contains_stationary_unit(location):
+                game.game_map.remove_unit(location)
+            else:
+                game.game_map.add_unit("FF", location, 0)
+            repaired = game.path_field(edge)
+            self.assertIsNot(before, repaired, "A new layout should get its own field")
+            self.assertEqual(PathField(bytes(game.game_map.blocked), end_points).pathlength, repaired.pathlength,
+                             "Repairing after flipping {} should match flooding from scratch".format(location))
+            before = repaired
+
+    def test_wall_placement_effects(self):
+        game = self.make_turn_0_map()
+        for x in range(4, 24):
+            if x != 13:
+                game.game_map.add_unit("FF", [x, 9], 0)
+        game.game_map.add_unit("DF", [21, 10], 0)
+        effects = game.wall_placement_effects()
+        starts = [location for edge in [game.game_map.TOP_LEFT, game.game_map.TOP_RIGHT] for location in game.game_map.get_edge_locations(edge)]
+        paths = game.find_paths_to_edges(starts)
+
+        self.assertEqual(False, (5, 9) in effects, "Tiles that already hold a structure can not take a wall")
+        self.assertEqual(False, (13, 14) in effects, "Only tiles on the defending half are candidates")
+        for location in [(13, 9), (12, 10), (2, 11), (13, 5)]:
+            walled = game.fork()
+            walled.game_map.add_unit("FF", list(location), 0)
+            walled_paths = walled.find_paths_to_edges(starts)
+            effect = effects[location]
+            self.assertEqual(sum(len(walled_paths[start]) - len(paths[start]) for start in paths), effect.length_change,
+                             "The length change of a wall at {} should match pathing a fork".format(location))
+            self.assertEqual(frozenset(tuple(step) for path in walled_paths.values() for step in path), effect.path_tiles,
+                             "The path tiles of a wall at {} should match pathing a fork".format(location))
+            self.assertAlmostEqual(sum(walled.threat_map(1).path_damage(path) - game.threat_map(1).path_damage(paths[start])
+                                       for start, path in walled_paths.items()), effect.exposure_change, 6,
+                                   "The exposure change of a wall at {} should match pathing a fork".format(location))
+            self.assertEqual(sum(path != walled_paths[start] for start, path in paths.items()), effect.changed_paths,
+                             "The changed paths of a wall at {} should match pathing a fork".format(location))
+        self.assertEqual(0, effects[(13, 5)].changed_paths, "A wall off every path should change nothing")
+
+        for location in [[13, 2], [14, 1], [13, 0]]:
+            game.game_map.add_unit("FF", location, 0)
+        pocket = game.wall_placement_effects(start_locations=[[13, 1]])
+        self.assertEqual(1, pocket[(12, 1)].blocks_edge, "Closing the only way out should stop the unit reaching its edge")
+
+    def test_enemy_path_atlas(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("FF", [13, 27], 1)
+        atlas = game.enemy_path_atlas()
+        starts = [location for edge in [game.game_map.TOP_LEFT, game.game_map.TOP_RIGHT]
+                  for location in game.game_map.get_edge_locations(edge) if location != [13, 27]]
+        self.assertEqual(game.find_paths_to_edges(starts), atlas.paths, "The atlas should hold the path from every open enemy spawn tile")
+        crossing = sum(1 for path in atlas.paths.values() if [13, 13] in path)
+        self.assertEqual(crossing, atlas.traversals_at([13, 13]), "Traversals should count the paths crossing a tile")
+        self.assertIs(atlas, game.enemy_path_atlas(), "The atlas should be kept while the layout is unchanged")
+
+        busiest = atlas.busiest(3, range(game.HALF_ARENA))
+        self.assertEqual(3, len(busiest), "busiest should return the requested number of tiles")
+        self.assertEqual(True, all(y < game.HALF_ARENA for _, y in busiest), "busiest should keep to the requested rows")
+        self.assertEqual(max(atlas.traversals[x * 28 + y] for x in range(28) for y in range(14)), atlas.traversals_at(busiest[0]),
+                         "The first tile should be the busiest")
+
+        game.game_map.add_unit("FF", busiest[0], 0)
+        self.assertIsNot(atlas, game.enemy_path_atlas(), "Changing the layout should predict the paths again")
+
+    def test_build_predicted_defense(self):
+        from algo_strategy import AlgoStrategy
+        game = self.make_turn_0_map()
+        # A wall line with one gap funnels every enemy path through [13, 13]
+        for x in range(game.ARENA_SIZE):
+            if x != 13:
+                game.game_map.add_unit("FF", [x, 13], 0)
+        algo = AlgoStrategy()
+        algo.on_game_start(game.config)
+        self.assertIsNone(algo.evaluator, "No worker pool should be created until sim_many is used")
+        atlas = game.enemy_path_atlas()
+        busiest = atlas.busiest(1, range(game.HALF_ARENA))[0]
+        algo.build_predicted_defense(game)
+        built = [location for location in game.game_map if location[1] != 13 and game.contains_stationary_unit(location)]
+        self.assertEqual(1, len(built), "One turret should be built")
+        turret = game.contains_stationary_unit(built[0])
+        self.assertEqual(("DF", True, 0), (turret.unit_type, built[0][1] < game.HALF_ARENA, atlas.traversals_at(built[0])),
+                         "The turret should be on our half and off every predicted path")
+        self.assertLessEqual(game.game_map.distance_between_locations(built[0], busiest), turret.attackRange,
+                             "The turret should cover the busiest tile")
+
+    def test_board_bytes(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        self.assertEqual(0, game_map.board_hash, "An empty board should hash to 0")
+        game_map.add_unit("DF", [13, 14], 1)
+        game_map.add_unit("FF", [12, 13], 0)
+        game_map.add_unit("PI", [13, 0], 0)
+        unupgraded_hash = game_map.board_hash
+        self.assertEqual((True, False), (game_map.upgrade_unit([13, 14]), game_map.upgrade_unit([13, 13])),
+                         "Only tiles holding a structure should be upgraded")
+        self.assertNotEqual(unupgraded_hash, game_map.board_hash, "Upgrading a structure should change the board hash")
+        game_map[13, 14][0].health = 41.5
+        game_map[12, 13][0].pending_removal = True
+
+        other = self.make_turn_0_map().game_map
+        other.add_unit("FF", [12, 13], 0)
+        other.add_unit("SI", [12, 12], 1)
+        other.add_unit("DF", [13, 14], 1)
+        other.remove_unit([12, 12])
+        other.upgrade_unit([13, 14])
+        self.assertEqual(game_map.board_hash, other.board_hash, "Equal layouts should hash equally however they were built")
+
+        fork = game.fork()
+        fork.game_map.remove_unit([12, 13])
+        self.assertNotEqual(game_map.board_hash, fork.game_map.board_hash, "Removing a structure should change the hash")
+        fork.game_map.add_unit("FF", [12, 13], 0)
+        self.assertEqual(game_map.board_hash, fork.game_map.board_hash, "Putting it back should restore the hash")
+
+        data = game_map.to_bytes()
+        self.assertEqual(len(self.make_turn_0_map().game_map.to_bytes()), len(data), "The buffer should have a fixed size")
+        rebuilt = GameMap.from_bytes(game.config, data)
+        self.assertEqual(game_map.board_hash, rebuilt.board_hash, "A rebuilt map should hash like the original")
+        self.assertEqual(str(game_map[13, 14]), str(rebuilt[13, 14]), "Type, owner, health and upgrade should survive the round trip")
+        self.assertEqual(True, rebuilt[12, 13][0].pending_removal, "Pending removal should survive the round trip")
+        self.assertEqual([], rebuilt[13, 0], "Mobile units are not packed")
+
+    def test_decoded_state(self):
+        game = self.make_turn_0_map()
+        turn = """{"p2Units":[[],[],[[13,14,90.0,"5"]],[],[],[],[],[]],"turnInfo":[0,3,-1],"p1Stats":[30.0,25.0,5.0,0],"p1Units":[[[13,13,75.0,"1"]],[],[],[],[],[],[],[[13,13,0,"1"]]],"p2Stats":[30.0,25.0,5.0,0],"events":{}}"""
+        from_string = GameState(game.config, turn)
+        from_dict = GameState(game.config, decode_json(turn))
+        self.assertEqual(json.loads(turn), decode_json(turn), "decode_json should match json.loads")
+        for location in [[13, 13], [13, 14]]:
+            self.assertEqual(str(from_string.game_map[location]), str(from_dict.game_map[location]), "A decoded state should parse like its string")
+        self.assertEqual(3, from_dict.turn_number, "The turn number should be read from a decoded state")
+
+    def test_peek_json(self):
+        frame = """{"p1Units":[[[13,13,75.0,"1"]]],"turnInfo": [1, 4, 17],"events":{"breach":[[[3,10],1,"PI","7",2]],"damage":[]}}"""
+        peeked = peek_json(frame, ["turnInfo", "breach", "death"])
+        self.assertEqual([1, 4, 17], peeked["turnInfo"], "turnInfo should be found without decoding the units")
+        self.assertEqual(json.loads(frame)["events"]["breach"], peeked["breach"], "Peeked events should decode like the full message")
+        self.assertEqual(False, "death" in peeked, "Missing keys should be left out")
+        self.assertEqual({"breach": peeked["breach"]}, peek_json(frame, ["breach", "turnInfo"], "events"),
+                         "Keys should only be searched for inside the section")
+        self.assertEqual({}, peek_json("""{"turnInfo":[1,4,17]}""", ["breach"], "events"), "A missing section should find nothing")
+
+    def test_frame_worker(self):
+        class FrameCounter(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frame_queue_size = 2
+                self.breaches = 0
+                self.breaches_at_turn = None
+
+            def on_action_frame(self, state):
+                time.sleep(0.001)
+                self.breaches += len(state["events"]["breach"])
+
+            def on_turn(self, state):
+                self.breaches_at_turn = self.breaches
+
+        config = json.dumps(self.make_turn_0_map().config)
+        frame = """{"turnInfo":[1,0,0],"events":{"breach":[[[3,10],1,"PI","7",2]]}}"""
+        turn = """{"turnInfo":[0,1,-1],"p1Stats":[30.0,25.0,5.0,0],"p2Stats":[30.0,25.0,5.0,0],"p1Units":[],"p2Units":[]}"""
+        messages = [config] + [frame] * 200 + [turn] + [frame] * 5 + ["""{"turnInfo":[2,1,0]}"""]
+        algo = FrameCounter()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("\n".join(messages) + "\n")
+        try:
+            algo.start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(200, algo.breaches_at_turn, "Every queued frame should be handled before on_turn, merged or not")
+        self.assertEqual(205, algo.breaches, "Frames left at the end of the game should still be handled")
+
+    def test_frame_interests(self):
+        class EventRecorder(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frame_interests = {"breach", "death"}
+                self.events = []
+
+            def on_action_frame(self, state):
+                self.events.append(state["events"])
+
+        config = json.dumps(self.make_turn_0_map().config)
+        frame = """{"turnInfo":[1,0,0],"p1Units":[[[13,13,75.0,"1"]]],"events":{"death":[],"breach":[[[3,10],1,"PI","7",2]]}}"""
+        quiet = """{"turnInfo":[1,0,1],"events":{"damage":[]}}"""
+        algo = EventRecorder()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("\n".join([config, frame, quiet, """{"turnInfo":[2,1,0]}"""]) + "\n")
+        try:
+            algo.start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual([{"breach": [[[3, 10], 1, "PI", "7", 2]], "death": []}, {"breach": [], "death": []}], algo.events,
+                         "Every listed event should be passed on, empty when the frame has none of it")
+
+    def test_speculative_plan(self):
+        class Speculator(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.frame_interests = {"breach"}
+                self.speculative_planner = count_structures
+                self.plans = []
+                self.speculated = []
+
+            def on_turn(self, state):
+                game_state = GameState(self.config, state)
+                deadline = time.time() + 30
+                while self._speculation is not None and not self._speculation.done() and time.time() < deadline:
+                    time.sleep(0.01)
+                self.speculated.append(self._speculation is not None)
+                self.plans.append(self.take_speculative_plan(game_state))
+
+        game = self.make_turn_0_map()
+        config = json.dumps(game.config)
+        units = """[[[13,13,75.0,"1"]],[],[],[],[],[],[],[]]"""
+        frame = """{"turnInfo":[1,%d,%d],"p1Stats":[30.0,25.0,5.0,0],"p2Stats":[30.0,25.0,5.0,0],"p1Units":%s,"p2Units":[],"events":{"breach":[]}}"""
+        turn = """{"turnInfo":[0,%d,-1],"p1Stats":[30.0,%s,0],"p2Stats":[30.0,25.0,5.0,0],"p1Units":%s,"p2Units":[],"events":{}}"""
+        moved = """[[[12,13,75.0,"1"]],[],[],[],[],[],[],[]]"""
+        # 25 SP and 5 MP become 30 SP and 5 * 0.75 + 5 = 8.8 MP next turn
+        messages = [config, frame % (0, 0, units), frame % (0, 1, units), turn % (1, "30.0,8.8", units),
+                    frame % (1, 0, units), turn % (2, "30.0,8.8", moved),
+                    frame % (2, 0, units), turn % (3, "29.0,8.8", units), """{"turnInfo":[2,3,0]}"""]
+        algo = Speculator()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("\n".join(messages) + "\n")
+        try:
+            algo.start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual((1, 1, [30.0, 8.8]), algo.plans[0], "The plan should be made for the predicted next turn and its income")
+        self.assertEqual(None, algo.plans[1], "A plan made for a different layout should be rejected")
+        self.assertEqual(None, algo.plans[2], "A plan expecting more resources than the turn has should be rejected")
+        self.assertEqual([True, True, True], algo.speculated, "Every action phase should start a speculation")
+
+    def test_parallel_evaluator(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("FF", [12, 14], 1)
+        game.game_map.upgrade_unit([13, 14])
+        game.game_map[12, 14][0].pending_removal = True
+        game.game_map[12, 14][0].health = 20.0
+
+        rebuilt = GameState(game.config, compact_state(game))
+        self.assertEqual([str(game.game_map[location]) for location in game.game_map],
+                         [str(rebuilt.game_map[location]) for location in rebuilt.game_map], "A packed state should rebuild the same board")
+        game.game_map.add_unit("SI", [13, 0], 0)
+        unpacked = _unpack_board(game.config, _pack_board(game))
+        self.assertEqual(([str(game.game_map[location]) for location in game.game_map], game.game_map.board_hash, game.get_resources(1)),
+                         ([str(unpacked.game_map[location]) for location in unpacked.game_map], unpacked.game_map.board_hash, unpacked.get_resources(1)),
+                         "The packed board sent to workers should rebuild the same state")
+        game.game_map.remove_unit([13, 0])
+
+        options = [[["PI", [13, 0], 3]], [["PI", [14, 0], 5]], [["EI", [3, 10], 2]]]
+        expected = Simulator(game).simulate_many(options)
+        evaluator = ParallelEvaluator(game.config, workers=2)
+        try:
+            results = evaluator.evaluate(game, options)
+            failed = evaluator.evaluate(game, options[:1] + [[["PI", None]]])
+            late = evaluator.evaluate(game, options, TurnBudget(0).start())
+        finally:
+            evaluator.close()
+        self.assertEqual((expected[0].breaches, None), (failed[0].breaches, failed[1]),
+                         "A failing option should come back as None without losing the others")
+        self.assertEqual([None] * len(options), late, "Nothing should be simulated once the budget has run out")
+        self.assertEqual([(result.breaches, result.structure_damage) for result in expected],
+                         [(result.breaches, result.structure_damage) for result in results], "Workers should simulate like the local simulator")
+
+    def test_transposition_table(self):
+        self.assertEqual((("PI", 13, 0, 3), ("SI", 14, 0, 1)), canonical_deployments([["SI", [14, 0]], ["PI", [13, 0], 2], ["PI", [13, 0]]]),
+                         "Deployments should be sorted and merged")
+
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        table = TranspositionTable(max_entries=2)
+        simulator = Simulator(game, transpositions=table)
+        first = simulator.simulate([["PI", [13, 0], 3]])
+        self.assertIsNotNone(first.state, "A fresh simulation should keep its state")
+        again = Simulator(game.fork(), transpositions=table).simulate([["PI", [13, 0], 2], ["PI", [13, 0]]])
+        self.assertEqual((1, first.breaches, first.structure_damage), (table.hits, again.breaches, again.structure_damage),
+                         "The same deployment on the same board should come from the table")
+
+        game.game_map[13, 14][0].health = 10.0
+        simulator.simulate([["PI", [13, 0], 3]])
+        self.assertEqual(1, table.hits, "Changing a structure's health should miss the table")
+        simulator.simulate([["PI", [14, 0]]])
+        self.assertEqual(2, len(table), "The least recently used entry should be evicted")
+
+    def test_turn_budget(self):
+        now = [100.0]
+        budget = TurnBudget(2.0, clock=lambda: now[0]).start()
+        now[0] += 1.5
+        self.assertAlmostEqual(0.5, budget.remaining(), 6, "Remaining time should count down from the start")
+        self.assertEqual(False, budget.expired(), "The budget should not expire early")
+        self.assertEqual(True, budget.expired(reserve=0.5), "Keeping time in reserve should expire the budget sooner")
+        self.assertAlmostEqual(0.25, budget.split(0.5).limit, 6, "A split should get its share of the remaining time")
+
+        seen = []
+        for item in budget.iterate(range(5)):
+            seen.append(item)
+            now[0] += 0.3
+        self.assertEqual([0, 1], seen, "Iteration should stop once the budget runs out")
+        self.assertEqual(4.0, TurnBudget.from_config(self.make_turn_0_map().config).limit, "The default budget should be 80% of the soft limit")
+
+        game = self.make_turn_0_map()
+        options = [[["PI", [13, 0]]], [["PI", [14, 0]]]]
+        self.assertEqual(1, len(Simulator(game).simulate_many(options, budget)), "An expired budget should still simulate one option")
+        self.assertEqual(2, len(Simulator(game).simulate_many(options)), "Without a budget every option should be simulated")
+
+        class Timed(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.limits = []
+
+            def on_turn(self, state):
+                self.limits.append(self.turn_budget.limit)
+
+        turn = """{"turnInfo":[0,%d,-1],"p1Stats":[30.0,25.0,5.0,%d],"p2Stats":[30.0,25.0,5.0,0],"p1Units":[],"p2Units":[],"events":{}}"""
+        algo = Timed()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO("\n".join([json.dumps(game.config), turn % (0, 0), turn % (1, 3000), """{"turnInfo":[2,1,0]}"""]) + "\n")
+        try:
+            algo.start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(4.0, algo.limits[0], "The first turn should get the full budget")
+        self.assertAlmostEqual(1.0, algo.limits[1], 1, "Time the engine counted beyond our own should come off the next budget")
+
+    def test_unit_type_table(self):
+        game = self.make_turn_0_map()
+        table = UnitTypeTable.for_config(game.config)
+        self.assertIs(table, UnitTypeTable.for_config(game.config), "The table should be built once per config")
+
+        turret = GameUnit("DF", game.config, 0, None, 13, 13)
+        self.assertIs(table.base["DF"], turret._record, "Units should share their type's record")
+        self.assertEqual([2.5, 5.0, 90.0, [2.0, 0]], [turret.attackRange, turret.damage_i, turret.health, turret.cost], "Base stats should come from the config")
+        turret.upgrade()
+        self.assertEqual([3.5, 15.0, [6.0, 0]], [turret.attackRange, turret.damage_i, turret.cost], "Upgraded stats should come from the upgrade block")
+        self.assertEqual(False, hasattr(turret, "__dict__"), "Units should not carry a per instance dict")
+
+    def test_unit_store(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 14], 1)
+        game.game_map.add_unit("PI", [13, 0], 0)
+        game.game_map.add_unit("PI", [13, 0], 0)
+        game.game_map.upgrade_unit([13, 14])
+
+        store = UnitStore.from_game_map(game.game_map)
+        fields = ["unit_type", "player_index", "x", "y", "stationary", "damage_i", "attackRange", "max_health", "health", "cost", "upgraded"]
+        for location in [[13, 14], [13, 0]]:
+            expected = [[getattr(unit, field) for field in fields] for unit in game.game_map[location]]
+            got = [[getattr(unit, field) for field in fields] for unit in store.units_at(location)]
+            self.assertEqual(expected, got, "Views should read like the GameUnits they were copied from")
+        self.assertEqual(str(game.game_map[13, 14][0]), str(store.units_at([13, 14])[0]), "Views should print like GameUnits")
+
+        store.units_at([13, 0])[0].health = 1
+        self.assertEqual(1, store.health[store.units_at([13, 0])[0].index], "Setting health through a view should write the column")
+        store.add("FF", [13, 14], 0)
+        self.assertEqual(["FF"], [unit.unit_type for unit in store.units_at([13, 14])], "A new structure should replace the old one")
+        self.assertEqual(3, len(store), "Replaced units should no longer count")
+        self.assertEqual(2, len(store.select(player_index=0, stationary=False)), "select should filter by owner and category")
+
     def test_print_unit(self):
         game = self.make_turn_0_map()
 
@@ -0,0 +1,113 @@
+from .game_map import ARENA_SIZE, ARENA_LOCATIONS, _tiles_in_range
+
+
+class ThreatMap:
+    """The threat enemy structures pose to one player's mobile units on every tile
+
+    Each attacking structure adds itself to every tile in its range once. After that the map
+    follows the GameMap it was built from, so spawning, removing or upgrading a structure
+    only updates the tiles that structure covers. Only structures are counted, so on a board
+    with mobile units on it get_attackers can report more attackers than this map.
+
+    Attributes :
+        * player_index (int): The defending player, 0 for you 1 for the enemy
+        * attackers (list): The number of structures attacking each tile, indexed by x * 28 + y
+        * damage (list): The total damage per frame those structures deal to mobile units on each tile, indexed by x * 28 + y
+
+    """
+    def __init__(self, game_map, player_index):
+        """Accumulates the threat from every structure on the map
+
+        Args:
+            * game_map: The GameMap to follow
+            * player_index: The defending player
+
+        """
+        self.player_index = player_index
+        self.attackers = [0] * (ARENA_SIZE * ARENA_SIZE)
+        self.damage = [0.0] * (ARENA_SIZE * ARENA_SIZE)
+        self._game_map = game_map
+        # What we added for the structure on each tile, so it can be taken back out
+        self._sources = [None] * (ARENA_SIZE * ARENA_SIZE)
+        for x, y in ARENA_LOCATIONS:
+            if game_map.blocked[x * ARENA_SIZE + y]:
+                self._tile_changed(x, y)
+        game_map._tile_listeners.append(self._tile_changed)
+
+    def _tile_changed(self, x, y):
+        index = x * ARENA_SIZE + y
+        source = self._sources[index]
+        if source is not None:
+            damage, tiles = source
+            for tile in tiles:
+                self.attackers[tile] -= 1
+                self.damage[tile] -= damage
+            self._sources[index] = None
+
+        if not self._game_map.blocked[index]:
+            return
+        for unit in self._game_map._units_at(x, y):
+            if unit.stationary and unit.player_index != self.player_index and unit.damage_i + unit.damage_f > 0:
+                # The same distance check as GameState.get_attackers
+                tiles = _tiles_in_range(unit.attackRange, 0, x, y, True)
+                for tile in tiles:
+                    self.attackers[tile] += 1
+                    self.damage[tile] += unit.damage_i
+                self._sources[index] = (unit.damage_i, tiles)
+                return
+
+    def fork(self, game_map):
+        """Copies this threat map for a fork of the GameMap it follows, without rescanning the board
+
+        Args:
+            game_map: The forked GameMap the copy should follow
+
+        Returns:
+            A ThreatMap following game_map
+
+        """
+        forked = ThreatMap.__new__(ThreatMap)
+        forked.player_index = self.player_index
+        forked.attackers = self.attackers[:]
+        forked.damage = self.damage[:]
+        forked._game_map = game_map
+        forked._sources = self._sources[:]
+        game_map._tile_listeners.append(forked._tile_changed)
+        return forked
+
+    def attackers_at(self, location):
+        """The number of structures that would attack a unit at location
+
+        Args:
+            location: A map location
+
+        Returns:
+            The number of attacking structures
+
+        """
+        return self.attackers[location[0] * ARENA_SIZE + location[1]]
+
+    def damage_at(self, location):
+        """The damage per frame a unit at location would take from structures
+
+        Args:
+            location: A map location
+
+        Returns:
+            The total damage per frame
+
+        """
+        return self.damage[location[0] * ARENA_SIZE + location[1]]
+
+    def path_damage(self, path):
+        """The damage per frame summed over every location of a path
+
+        Args:
+            path: A list of locations, such as one returned by GameState.find_path_to_edge
+
+        Returns:
+            The summed damage
+
+        """
+        damage = self.damage
+        return sum(damage[x * ARENA_SIZE + y] for x, y in path)
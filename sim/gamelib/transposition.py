@@ -0,0 +1,133 @@
+import copy
+import hashlib
+from collections import OrderedDict
+
+from .game_map import ARENA_SIZE, ARENA_LOCATIONS
+
+
+def canonical_deployments(deployments):
+    """Puts a deployment list in a standard form, so the same units deployed in any order give the same key
+
+    Args:
+        deployments: A list of (unit_type, location) or (unit_type, location, count) entries, as Simulator.simulate takes
+
+    Returns:
+        A sorted tuple of (unit_type, x, y, count), with repeated entries for a tile and type added together
+
+    """
+    counts = {}
+    for deployment in deployments:
+        unit_type, location = deployment[0], deployment[1]
+        key = (unit_type, int(location[0]), int(location[1]))
+        counts[key] = counts.get(key, 0) + (deployment[2] if len(deployment) > 2 else 1)
+    return tuple(sorted(key + (count,) for key, count in counts.items()))
+
+
+def board_digest(game_state):
+    """A digest of everything on the board a simulation depends on: structures with their health and upgrades,
+    and any mobile units already on the board.
+
+    Args:
+        game_state: The state to digest
+
+    Returns:
+        A 64 bit integer
+
+    """
+    game_map = game_state.game_map
+    digest = hashlib.blake2b(game_map.to_bytes(), digest_size=8)
+    for x, y in ARENA_LOCATIONS:
+        if game_map.blocked[x * ARENA_SIZE + y]:
+            continue
+        for unit in game_map._units_at(x, y):
+            digest.update("{},{},{},{},{};".format(unit.unit_type, unit.player_index, x, y, unit.health).encode())
+    return int.from_bytes(digest.digest(), "little")
+
+
+class TranspositionTable:
+    """Remembers simulated outcomes, so a deployment tried again on the same board is not simulated again
+
+    Entries are keyed by the board's structure hash, a digest of the rest of the board (health and mobile units),
+    the frame limit and the canonical form of the deployments. When the table is full the least recently used
+    entry is evicted. Keep one for the whole game: boards the enemy did not change keep their entries from turn
+    to turn.
+
+    Results are stored without their final state, and the same object is returned by every lookup, so do not
+    change them.
+
+    Attributes :
+        * max_entries (int): The number of results kept
+        * hits (int): The number of lookups that found a result
+        * misses (int): The number of lookups that did not
+
+    """
+    def __init__(self, max_entries=4096):
+        """Sets up an empty table
+
+        Args:
+            max_entries: The number of results to keep
+
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def board_key(self, game_state, max_frames=1000):
+        """The part of an entry's key describing the board a simulation starts from.
+        Work it out once and pass it to get and put when looking up many deployments on one board.
+
+        Args:
+            * game_state: The state simulations start from
+            * max_frames: The simulator's frame limit
+
+        Returns:
+            A hashable key
+
+        """
+        return (game_state.game_map.board_hash, board_digest(game_state), max_frames)
+
+    def get(self, board_key, deployments):
+        """Looks up the result of a deployment
+
+        Args:
+            * board_key: The key from board_key
+            * deployments: The deployment list
+
+        Returns:
+            The stored SimulationResult, or None if there is none
+
+        """
+        key = (board_key, canonical_deployments(deployments))
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, board_key, deployments, result):
+        """Stores a copy of the result of a deployment, without its state to keep the table small
+
+        Args:
+            * board_key: The key from board_key
+            * deployments: The deployment list
+            * result: The SimulationResult
+
+        """
+        result = copy.copy(result)
+        result.state = None
+        key = (board_key, canonical_deployments(deployments))
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forgets every stored result
+        """
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
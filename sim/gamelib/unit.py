@@ -1,3 +1,6 @@
+from collections import namedtuple
+
+
 def is_stationary(unit_type, structure_types):
     """
         Args:
@@ -9,6 +12,71 @@ def is_stationary(unit_type, structure_types):
     return unit_type in structure_types
 
 
+"""
+The stats of one unit type, either as built or once upgraded. Field names match the GameUnit attributes they back.
+"""
+UnitTypeRecord = namedtuple("UnitTypeRecord", ["stationary", "speed", "damage_f", "damage_i", "attackRange", "shieldRange",
+                                               "max_health", "shieldPerUnit", "shieldBonusPerY", "cost"])
+
+_RECORD_KEYS = [("speed", "speed"), ("damage_f", "attackDamageTower"), ("damage_i", "attackDamageWalker"),
+                ("attackRange", "attackRange"), ("shieldRange", "shieldRange"), ("max_health", "startHealth"),
+                ("shieldPerUnit", "shieldPerUnit"), ("shieldBonusPerY", "shieldBonusPerY")]
+
+
+class UnitTypeTable:
+    """The base and upgraded stats of every unit type in a config, read from the config once
+
+    Attributes :
+        * config (JSON): The config the table was built from
+        * type_index (dict): The index in config["unitInformation"] of every unit type
+        * base (dict): The UnitTypeRecord of every unit type as built
+        * upgraded (dict): The UnitTypeRecord of every unit type once upgraded
+
+    """
+    _tables = {}
+
+    def __init__(self, config):
+        """Reads every unit type from a config
+
+        Args:
+            config (JSON): Contains information about the game
+
+        """
+        self.config = config
+        self.type_index = {}
+        self.base = {}
+        self.upgraded = {}
+        for index, type_config in enumerate(config["unitInformation"]):
+            unit_type = type_config.get("shorthand")
+            stationary = type_config.get("unitCategory") == 0
+            stats = [type_config.get(key, 0) for _, key in _RECORD_KEYS]
+            cost = (type_config.get("cost1", 0), type_config.get("cost2", 0))
+            upgrade_config = type_config.get("upgrade", {})
+            upgraded_stats = [upgrade_config.get(key, value) for (_, key), value in zip(_RECORD_KEYS, stats)]
+            upgraded_cost = (upgrade_config.get("cost1", 0) + cost[0], upgrade_config.get("cost2", 0) + cost[1])
+            self.type_index[unit_type] = index
+            self.base[unit_type] = UnitTypeRecord(stationary, *stats, cost)
+            self.upgraded[unit_type] = UnitTypeRecord(stationary, *upgraded_stats, upgraded_cost)
+
+    @classmethod
+    def for_config(cls, config):
+        """Gets the table for a config, building it the first time the config is seen
+
+        Args:
+            config (JSON): Contains information about the game
+
+        Returns:
+            The UnitTypeTable for config
+
+        """
+        entry = cls._tables.get(id(config))
+        # The config is kept in the entry, so its id can not be reused by another config while it is cached
+        if entry is None or entry.config is not config:
+            entry = cls(config)
+            cls._tables[id(config)] = entry
+        return entry
+
+
 class GameUnit:
     """Holds information about a Unit. 
 
@@ -32,6 +100,8 @@ class GameUnit:
         * upgraded (boolean): If this unit is upgraded
 
     """
+    __slots__ = ["unit_type", "config", "player_index", "pending_removal", "upgraded", "x", "y", "health", "_record"]
+
     def __init__(self, unit_type, config, player_index=None, health=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -43,39 +113,57 @@ class GameUnit:
         self.upgraded = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.health = self.max_health if not health else health
-
-    def __serialize_type(self):
-        from .game_state import STRUCTURE_TYPES, UNIT_TYPE_TO_INDEX, SUPPORT
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        self.stationary = type_config["unitCategory"] == 0
-        self.speed = type_config.get("speed", 0)
-        self.damage_f = type_config.get("attackDamageTower", 0)
-        self.damage_i = type_config.get("attackDamageWalker", 0)
-        self.attackRange = type_config.get("attackRange", 0)
-        self.shieldRange = type_config.get("shieldRange", 0)
-        self.max_health = type_config.get("startHealth", 0)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", 0)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", 0)
-        self.cost = [type_config.get("cost1", 0), type_config.get("cost2", 0)]
+        self._record = UnitTypeTable.for_config(config).base[unit_type]
+        self.health = self._record.max_health if not health else health
+
+    @property
+    def stationary(self):
+        return self._record.stationary
+
+    @property
+    def speed(self):
+        return self._record.speed
+
+    @property
+    def damage_f(self):
+        return self._record.damage_f
 
+    @property
+    def damage_i(self):
+        return self._record.damage_i
+
+    @property
+    def attackRange(self):
+        return self._record.attackRange
+
+    @property
+    def shieldRange(self):
+        return self._record.shieldRange
+
+    @property
+    def max_health(self):
+        return self._record.max_health
+
+    @property
+    def shieldPerUnit(self):
+        return self._record.shieldPerUnit
+
+    @property
+    def shieldBonusPerY(self):
+        return self._record.shieldBonusPerY
+
+    @property
+    def cost(self):
+        return list(self._record.cost)
 
     def upgrade(self):
-        from .game_state import UNIT_TYPE_TO_INDEX
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]].get("upgrade", {})
-        self.speed = type_config.get("speed", self.speed)
-        self.damage_f = type_config.get("attackDamageTower", self.damage_f)
-        self.damage_i = type_config.get("attackDamageWalker", self.damage_i)
-        self.attackRange = type_config.get("attackRange", self.attackRange)
-        self.shieldRange = type_config.get("shieldRange", self.shieldRange)
-        self.max_health = type_config.get("startHealth", self.max_health)
-        self.shieldPerUnit = type_config.get("shieldPerUnit", self.shieldPerUnit)
-        self.shieldBonusPerY = type_config.get("shieldBonusPerY", self.shieldBonusPerY)
-        self.cost = [type_config.get("cost1", 0) + self.cost[0], type_config.get("cost2", 0) + self.cost[1]]
+        """Switches the unit to its upgraded stats.
+        For a structure already on a GameMap use GameMap.upgrade_unit instead, which also updates the map's
+        board_hash and threat maps. This leaves them describing the unit before the upgrade.
+        """
+        self._record = UnitTypeTable.for_config(self.config).upgraded[self.unit_type]
         self.upgraded = True
 
-
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
         removal = ", pending removal" if self.pending_removal else ""
@@ -0,0 +1,314 @@
+from array import array
+from .game_map import ARENA_SIZE
+from .unit import UnitTypeTable, UnitTypeRecord
+from .util import decode_json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The config indices of the removal and upgrade pseudo units in a serialized game state
+_REMOVE_INDEX = 6
+_UPGRADE_INDEX = 7
+
+
+class UnitView:
+    """A unit stored in a UnitStore, with the same fields as a GameUnit
+
+    Views hold no data of their own. Reading a field reads the store's columns, and setting health,
+    pending_removal or calling upgrade() writes them. Stats like attackRange come from the store's
+    UnitTypeRecords, so a view costs two references however many stats it has.
+
+    """
+    __slots__ = ["_store", "_index"]
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        if name not in UnitTypeRecord._fields:
+            raise AttributeError(name)
+        return getattr(self._record(), name)
+
+    def _record(self):
+        store = self._store
+        return store._stats[store.upgraded[self._index]][store.type_index[self._index]]
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def config(self):
+        return self._store.config
+
+    @property
+    def unit_type(self):
+        return self._store.shorthands[self._store.type_index[self._index]]
+
+    @property
+    def player_index(self):
+        return self._store.owner[self._index]
+
+    @property
+    def x(self):
+        return self._store.x[self._index]
+
+    @property
+    def y(self):
+        return self._store.y[self._index]
+
+    @property
+    def cost(self):
+        return list(self._record().cost)
+
+    @property
+    def health(self):
+        return self._store.health[self._index]
+
+    @health.setter
+    def health(self, value):
+        self._store.health[self._index] = value
+
+    @property
+    def upgraded(self):
+        return bool(self._store.upgraded[self._index])
+
+    @property
+    def pending_removal(self):
+        return bool(self._store.pending_removal[self._index])
+
+    @pending_removal.setter
+    def pending_removal(self, value):
+        self._store.pending_removal[self._index] = bool(value)
+
+    def upgrade(self):
+        self._store.upgraded[self._index] = 1
+
+    def __eq__(self, other):
+        return isinstance(other, UnitView) and other._store is self._store and other._index == self._index
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+    def __toString(self):
+        owner = "Friendly" if self.player_index == 0 else "Enemy"
+        removal = ", pending removal" if self.pending_removal else ""
+        return "{} {}, health: {} location: {} removal: {} upgrade: {} ".format(owner, self.unit_type, self.health, [self.x, self.y], removal, self.upgraded)
+
+    def __str__(self):
+        return self.__toString()
+
+    def __repr__(self):
+        return self.__toString()
+
+
+class UnitStore:
+    """Holds units column by column instead of as one GameUnit object each
+
+    Every unit is a row index into the columns below. Removed units keep their row, with alive set to 0,
+    so indices and views stay valid for the life of the store. The tiles index lists the live rows on
+    every tile, so units_at is as cheap as game_map[x, y].
+
+    Attributes :
+        * config (JSON): Contains information about the game
+        * shorthands (list): The unit type shorthand for every type index, in config order
+        * x (array): The x coordinate of every unit
+        * y (array): The y coordinate of every unit
+        * type_index (array): The index of every unit's type in config["unitInformation"]
+        * owner (array): The player controlling every unit, 0 for you 1 for the enemy
+        * health (array): The current health of every unit
+        * upgraded (bytearray): 1 for every upgraded unit
+        * pending_removal (bytearray): 1 for every unit marked for removal by its owner
+        * alive (bytearray): 1 for every unit still on the board
+        * tiles (list): The rows of the live units on every tile, indexed by x * 28 + y
+
+    """
+    def __init__(self, config):
+        """Sets up an empty store
+
+        Args:
+            config (JSON): Contains information about the game
+
+        """
+        self.config = config
+        unit_types = UnitTypeTable.for_config(config)
+        self.shorthands = [type_config.get("shorthand") for type_config in config["unitInformation"]]
+        self._type_indices = unit_types.type_index
+        self._stats = ([unit_types.base[shorthand] for shorthand in self.shorthands],
+                       [unit_types.upgraded[shorthand] for shorthand in self.shorthands])
+        self.x = array("b")
+        self.y = array("b")
+        self.type_index = array("b")
+        self.owner = array("b")
+        self.health = array("d")
+        self.upgraded = bytearray()
+        self.pending_removal = bytearray()
+        self.alive = bytearray()
+        self.tiles = [[] for _ in range(ARENA_SIZE * ARENA_SIZE)]
+
+    @classmethod
+    def from_game_map(cls, game_map):
+        """Copies every unit of a GameMap into a new store
+
+        Args:
+            game_map: The GameMap to copy
+
+        Returns:
+            A UnitStore holding the same units
+
+        """
+        store = cls(game_map.config)
+        for x, y in game_map:
+            for unit in game_map._units_at(x, y):
+                index = store.add(unit.unit_type, [x, y], unit.player_index, unit.health).index
+                store.upgraded[index] = unit.upgraded
+                store.pending_removal[index] = unit.pending_removal
+        return store
+
+    @classmethod
+    def from_serialized_state(cls, config, serialized_string):
+        """Parses the units of a game state straight into a new store, without building any GameUnit
+
+        Args:
+            * config (JSON): Contains information about the game
+            * serialized_string (string or dict): A game state, as passed to GameState
+
+        Returns:
+            A UnitStore holding the state's units
+
+        """
+        state = decode_json(serialized_string) if isinstance(serialized_string, (str, bytes)) else serialized_string
+        store = cls(config)
+        store.parse_units(state["p1Units"], 0)
+        store.parse_units(state["p2Units"], 1)
+        return store
+
+    def parse_units(self, units, player_index):
+        """Adds one player's units from a serialized game state, applying removal and upgrade markers like GameState does
+
+        Args:
+            * units: The lists of [x, y, health, id] entries for each unit type, as found in p1Units or p2Units
+            * player_index: The player controlling the units
+
+        """
+        for type_index, unit_types in enumerate(units):
+            for uinfo in unit_types:
+                x, y = int(uinfo[0]), int(uinfo[1])
+                if type_index == _REMOVE_INDEX or type_index == _UPGRADE_INDEX:
+                    structure = self._structure_row(x, y)
+                    if structure is not None:
+                        if type_index == _REMOVE_INDEX:
+                            self.pending_removal[structure] = 1
+                        else:
+                            self.upgraded[structure] = 1
+                else:
+                    self._append(type_index, x, y, player_index, float(uinfo[2]))
+
+    def add(self, unit_type, location, player_index=0, health=None):
+        """Adds a unit, replacing whatever is on the tile if the unit is a structure
+
+        Args:
+            * unit_type: The type of the new unit
+            * location: The [x, y] location of the new unit
+            * player_index: The player controlling the new unit
+            * health: The unit's health, its starting health by default
+
+        Returns:
+            A UnitView of the new unit
+
+        """
+        type_index = self._type_indices[unit_type]
+        x, y = location
+        if self._stats[0][type_index].stationary:
+            self.remove_unit(location)
+        return UnitView(self, self._append(type_index, x, y, player_index, health))
+
+    def _append(self, type_index, x, y, player_index, health):
+        index = len(self.alive)
+        self.x.append(x)
+        self.y.append(y)
+        self.type_index.append(type_index)
+        self.owner.append(player_index)
+        self.health.append(health if health else self._stats[0][type_index].max_health)
+        self.upgraded.append(0)
+        self.pending_removal.append(0)
+        self.alive.append(1)
+        self.tiles[x * ARENA_SIZE + y].append(index)
+        return index
+
+    def _structure_row(self, x, y):
+        for index in self.tiles[x * ARENA_SIZE + y]:
+            if self._stats[0][self.type_index[index]].stationary:
+                return index
+        return None
+
+    def remove_unit(self, location):
+        """Removes every unit on a tile
+
+        Args:
+            location: The location to empty
+
+        """
+        tile = self.tiles[location[0] * ARENA_SIZE + location[1]]
+        for index in tile:
+            self.alive[index] = 0
+        del tile[:]
+
+    def units_at(self, location):
+        """Gets views of the units on a tile, like game_map[x, y]
+
+        Args:
+            location: A map location
+
+        Returns:
+            A list of UnitViews
+
+        """
+        return [UnitView(self, index) for index in self.tiles[location[0] * ARENA_SIZE + location[1]]]
+
+    def select(self, player_index=None, unit_type=None, stationary=None):
+        """Finds the live units matching every given filter
+
+        Args:
+            * player_index: Only units of this player
+            * unit_type: Only units of this type
+            * stationary: Only structures if True, only mobile units if False
+
+        Returns:
+            A list of row indices
+
+        """
+        type_index = None if unit_type is None else self._type_indices[unit_type]
+        return [index for index in range(len(self.alive)) if self.alive[index]
+                and (player_index is None or self.owner[index] == player_index)
+                and (type_index is None or self.type_index[index] == type_index)
+                and (stationary is None or self._stats[0][self.type_index[index]].stationary == stationary)]
+
+    def columns(self):
+        """Copies the columns into NumPy arrays for vectorized queries over every unit, including removed ones.
+
+        Returns:
+            A dict of NumPy arrays keyed by column name, or None if NumPy is not installed
+
+        """
+        if numpy is None:
+            return None
+        return {
+            "x": numpy.frombuffer(self.x, dtype=numpy.int8).copy(),
+            "y": numpy.frombuffer(self.y, dtype=numpy.int8).copy(),
+            "type_index": numpy.frombuffer(self.type_index, dtype=numpy.int8).copy(),
+            "owner": numpy.frombuffer(self.owner, dtype=numpy.int8).copy(),
+            "health": numpy.frombuffer(self.health, dtype=numpy.float64).copy(),
+            "upgraded": numpy.frombuffer(self.upgraded, dtype=numpy.uint8).copy(),
+            "pending_removal": numpy.frombuffer(self.pending_removal, dtype=numpy.uint8).copy(),
+            "alive": numpy.frombuffer(self.alive, dtype=numpy.uint8).copy(),
+        }
+
+    def __len__(self):
+        return sum(self.alive)
+
+    def __iter__(self):
+        return (UnitView(self, index) for index in range(len(self.alive)) if self.alive[index])
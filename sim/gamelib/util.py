@@ -1,5 +1,18 @@
 import sys
+import re
+import json
 
+# The fastest JSON decoder installed. Both orjson and ujson produce the same dicts and lists as json.
+try:
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = None
+
+_DECODER = json.JSONDecoder()
+_KEY_PATTERNS = {}
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
@@ -21,6 +34,53 @@ def get_command():
         exit()
     return ret
 
+def decode_json(message):
+    """Decodes a JSON message from the game engine, using orjson or ujson when one is installed
+
+    Args:
+        message: The JSON string
+
+    Returns:
+        The decoded object
+
+    """
+    if _fast_json is not None:
+        return _fast_json.loads(message)
+    return json.loads(message)
+
+def peek_json(message, keys, section=None):
+    """Decodes the values of a few keys of a JSON message without decoding the rest of it
+
+    Each key is found with a text search, so a key must not also appear in the message as a string value.
+    This holds for the top level keys and event names of the engine's messages.
+
+    Args:
+        * message: The JSON string
+        * keys: The names of the keys to decode
+        * section: The key whose value holds the keys, such as "events". It is searched for from the end of the
+          message and the keys only after it, so when the section comes last, as events does in the engine's
+          frames, the units before it are never scanned.
+
+    Returns:
+        A dict with the decoded value of every key that was found
+
+    """
+    start = 0
+    if section is not None:
+        start = message.rfind('"{}"'.format(section))
+        if start < 0:
+            return {}
+    found = {}
+    for key in keys:
+        pattern = _KEY_PATTERNS.get(key)
+        if pattern is None:
+            pattern = re.compile('"{}"\\s*:\\s*'.format(re.escape(key)))
+            _KEY_PATTERNS[key] = pattern
+        match = pattern.search(message, start)
+        if match is not None:
+            found[key] = _DECODER.raw_decode(message, match.end())[0]
+    return found
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'